@@ -1,14 +1,181 @@
 """AI Agent with multi-provider LLM support and function calling."""
 
 import asyncio
-from typing import List, Dict, Optional, Tuple, Any
+import functools
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from types import MappingProxyType
+from dataclasses import dataclass
+from typing import List, Dict, Optional, Tuple, Any, AsyncIterator, Union
 from loguru import logger
+import httpx
+import orjson
 from openai import AsyncOpenAI
 import google.generativeai as genai
 
 from app.models import UserContext, Message
+from app.semantic_cache import SemanticResponseCache
 from app.utils import retry_with_backoff
-from app.prompts import USER_SUMMARY_PROMPT, BASE_PROMPT,CHAT_INTEREST_PROMPT, TOPIC_INTEREST_PROMPT
+from app.prompts import (
+    build_base_prompt,
+    build_chat_interest_prompt,
+    build_topic_interest_prompt,
+    build_user_summary_prompt
+)
+
+
+# User turns matching this are likely to trigger a web_search call, so the
+# search is started speculatively while the first LLM round-trip is in flight.
+_SEARCH_HINT_RE = re.compile(
+    r"\b(latest|news|today|yesterday|tonight|current(ly)?|recent(ly)?|breaking|"
+    r"this (week|month|year)|price|score|weather|20\d\d)\b",
+    re.IGNORECASE
+)
+_SPECULATIVE_SEARCH_COUNT = 5
+
+# web_search function schema shared by every agent; read-only at the top level
+_WEB_SEARCH_SCHEMA = MappingProxyType({
+    "name": "web_search",
+    "description": "Search the web for current information when the user asks about recent events, news, or information that may not be in your training data",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "query": {
+                "type": "string",
+                "description": "The search query to find relevant information"
+            },
+            "count": {
+                "type": "integer",
+                "description": "Number of search results to return (default: 5)",
+                "default": 5
+            }
+        },
+        "required": ["query"]
+    }
+})
+
+# The OpenAI SDK JSON-encodes its arguments, which needs a real dict
+_OPENAI_FUNCTIONS = [dict(_WEB_SEARCH_SCHEMA)]
+
+# Gemini uses TYPE_STRING, TYPE_INTEGER instead of "string", "integer"
+_GEMINI_FUNCTION_DECLARATION = {
+    "name": _WEB_SEARCH_SCHEMA["name"],
+    "description": _WEB_SEARCH_SCHEMA["description"],
+    "parameters": {
+        "type_": "OBJECT",
+        "properties": {
+            "query": {
+                "type_": "STRING",
+                "description": _WEB_SEARCH_SCHEMA["parameters"]["properties"]["query"]["description"]
+            },
+            "count": {
+                "type_": "INTEGER",
+                "description": _WEB_SEARCH_SCHEMA["parameters"]["properties"]["count"]["description"]
+            }
+        },
+        "required": ["query"]
+    }
+}
+
+# Gemini only knows "user" and "model" turns; anything else (assistant,
+# function results) is sent as a model turn.
+_GEMINI_ROLES = {"user": "user", "assistant": "model"}
+_GEMINI_PREAMBLE_REPLY = {"role": "model", "parts": ["Understood. I'll follow these instructions."]}
+
+
+def _log_discarded_search(task: asyncio.Task) -> None:
+    """Log a speculative search failure so an unused task is not reported as never retrieved."""
+    if not task.cancelled() and task.exception() is not None:
+        logger.debug(f"Speculative web search failed: {type(task.exception()).__name__}: {task.exception()}")
+
+
+def _digest(text: Optional[str]) -> bytes:
+    """Return a short, stable digest of a prompt fragment for cache keys."""
+    return hashlib.blake2b((text or "").encode(), digest_size=16).digest()
+
+
+@dataclass
+class _PreparedMessages:
+    """
+    Provider-formatted views of one conversation.
+    
+    Built once per request so the post-function-call round-trip only
+    translates the newly appended messages instead of the whole history.
+    """
+    openai: List[Dict[str, Any]]
+    gemini: List[Dict[str, Any]]
+    # Stable per system prompt (which carries the user's summary), so OpenAI
+    # routes a conversation's turns to servers holding its cached prefix
+    prompt_cache_key: str = ""
+    
+    @classmethod
+    def build(cls, messages: List[Dict[str, Any]], system_prompt: str) -> "_PreparedMessages":
+        """Translate messages for both providers, prepending the system prompt."""
+        prepared = cls(
+            openai=[{"role": "system", "content": system_prompt}],
+            gemini=[{"role": "user", "parts": [system_prompt]}, _GEMINI_PREAMBLE_REPLY],
+            prompt_cache_key=_digest(system_prompt).hex()
+        )
+        prepared.extend(messages)
+        return prepared
+    
+    def extend(self, messages: List[Dict[str, Any]]) -> None:
+        """Append messages to both views; Gemini skips empty content."""
+        self.openai.extend(messages)
+        self.gemini.extend(
+            {"role": _GEMINI_ROLES.get(msg["role"], "model"), "parts": [msg["content"]]}
+            for msg in messages
+            if msg.get("content")
+        )
+
+
+def _assemble_system_prompt(
+    chat_interest: Optional[str],
+    topics: Tuple[str, ...],
+    birthdate: Optional[str],
+    user_summary: Optional[str],
+    is_first_message: bool
+) -> str:
+    """Assemble the system prompt from hashable user context fields."""
+    return build_base_prompt(
+        (build_chat_interest_prompt(chat_interest) if chat_interest else "")
+        + (build_topic_interest_prompt(", ".join(topics)) if topics else "")
+        + (f"\n###User's birthdate: {birthdate}" if birthdate else "")
+        + (
+            build_user_summary_prompt(user_summary)
+            if not is_first_message and user_summary else ""
+        )
+    )
+
+
+@functools.lru_cache(maxsize=1024)
+def _build_system_prompt_cached(
+    chat_interest: Optional[str],
+    topics: Tuple[str, ...],
+    birthdate: Optional[str],
+    user_summary: Optional[str]
+) -> str:
+    """
+    Return the returning-user system prompt, memoized.
+    
+    The prompt only changes when the user's context does, so consecutive
+    turns of a conversation are served from the LRU cache.
+    """
+    return _assemble_system_prompt(chat_interest, topics, birthdate, user_summary, False)
+
+
+def _latest_search_query(messages: List[Dict[str, str]]) -> Optional[str]:
+    """Return the latest user message if it looks like a web search query."""
+    if not messages:
+        return None
+    
+    last_message = messages[-1]
+    query = last_message.get("content") or ""
+    if last_message.get("role") != "user" or not _SEARCH_HINT_RE.search(query):
+        return None
+    return query
 
 
 class AIAgent:
@@ -22,12 +189,17 @@ class AIAgent:
     Requirements: 6.1, 6.2, 6.3, 6.4, 6.5, 6.6, 5.2, 5.3, 13.6, 13.7, 13.11, 11.3
     """
     
+    function_schema = _WEB_SEARCH_SCHEMA
+    
     def __init__(
         self,
         openai_key: str,
         gemini_key: str,
         default_provider: str = "openai",
-        search_service: Optional[Any] = None
+        search_service: Optional[Any] = None,
+        response_cache_size: int = 256,
+        semantic_cache_threshold: Optional[float] = None,
+        http_limits: Optional[httpx.Limits] = None
     ):
         """
         Initialize AI Agent with LLM providers.
@@ -37,9 +209,22 @@ class AIAgent:
             gemini_key: Google Gemini API key
             default_provider: Default LLM provider to use ("openai" or "gemini")
             search_service: Optional SearchService instance for function calling
+            response_cache_size: Maximum number of exact-match responses and
+                summaries kept in the in-process LRU cache (0 disables it)
+            semantic_cache_threshold: Cosine similarity above which a response
+                to a near-duplicate user message in the same context is reused
+                (None disables the semantic cache)
+            http_limits: Connection pool limits for the OpenAI HTTP client
+                (default: 256 connections, 128 kept alive)
         """
-        # Initialize OpenAI client
-        self.openai_client = AsyncOpenAI(api_key=openai_key)
+        # Initialize OpenAI client on a pooled HTTP/2 connection so concurrent
+        # requests share warm connections instead of re-handshaking
+        self._openai_http_client = httpx.AsyncClient(
+            http2=True,
+            limits=http_limits or httpx.Limits(max_connections=256, max_keepalive_connections=128),
+            timeout=httpx.Timeout(30.0, connect=5.0)
+        )
+        self.openai_client = AsyncOpenAI(api_key=openai_key, http_client=self._openai_http_client)
         
         # Initialize Gemini client
         genai.configure(api_key=gemini_key)
@@ -47,29 +232,40 @@ class AIAgent:
         self.default_provider = default_provider
         self.search_service = search_service
         
-        # Function calling schema
-        self.function_schema = {
-            "name": "web_search",
-            "description": "Search the web for current information when the user asks about recent events, news, or information that may not be in your training data",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "query": {
-                        "type": "string",
-                        "description": "The search query to find relevant information"
-                    },
-                    "count": {
-                        "type": "integer",
-                        "description": "Number of search results to return (default: 5)",
-                        "default": 5
-                    }
-                },
-                "required": ["query"]
-            }
-        }
+        # Exact-match LRU cache of LLM outputs keyed on provider + prompt digests
+        self._response_cache: "OrderedDict[Tuple, str]" = OrderedDict()
+        self._response_cache_size = response_cache_size
+        
+        # Opt-in: every cache miss costs an embedding request
+        self._semantic_cache: Optional[SemanticResponseCache] = (
+            SemanticResponseCache(self._embed, threshold=semantic_cache_threshold)
+            if semantic_cache_threshold is not None else None
+        )
+        
+        # Gemini model is constant per agent, so build it once
+        self._gemini_model = genai.GenerativeModel(
+            model_name="models/gemini-2.5-flash",
+            tools=[_GEMINI_FUNCTION_DECLARATION]
+        )
+        self._gemini_generation_config = genai.types.GenerationConfig(temperature=0.7)
         
         logger.info(f"AIAgent initialized: default_provider={default_provider}")
     
+    async def close(self) -> None:
+        """
+        Close the pooled OpenAI HTTP client.
+        
+        Should be called during application shutdown to release connections.
+        """
+        await self._openai_http_client.aclose()
+        logger.info("AIAgent closed")
+    
+    async def __aenter__(self) -> "AIAgent":
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
+    
     def _build_system_prompt(
         self,
         user_context: UserContext,
@@ -90,36 +286,17 @@ class AIAgent:
             
         Requirements: 6.1
         """
-        prompt_parts = []
-        
-        # Add user interest information
-        if user_context.chatInterest:
-            prompt_parts.append(
-                CHAT_INTEREST_PROMPT.format(interest = user_context.chatInterest)
-            )
-        
-        # Add topics
-        if user_context.topics:
-            topics_str = ", ".join(user_context.topics)
-            prompt_parts.append(
-                TOPIC_INTEREST_PROMPT.format(topics = topics_str)
-            )
-        
-        # Add birthdate if available
-        if user_context.birthdate:
-            prompt_parts.append(
-                f"\n###User's birthdate: {user_context.birthdate}"
-            )
-        
-        # Add conversation summary for returning users
-        if not is_first_message and user_context.userSummary:
-            prompt_parts.append(
-                USER_SUMMARY_PROMPT.format(summary = user_context.userSummary)
-            )
-        
-        parts = "".join(prompt_parts)
-
-        return BASE_PROMPT.format(parts = parts)
+        fields = (
+            user_context.chatInterest,
+            tuple(user_context.topics or ()),
+            user_context.birthdate,
+            user_context.userSummary
+        )
+        # A first-message prompt is built once per user, so caching it would
+        # only evict the returning-user prompts that are actually reused
+        if is_first_message:
+            return _assemble_system_prompt(*fields, True)
+        return _build_system_prompt_cached(*fields)
 
 
 
@@ -128,7 +305,8 @@ class AIAgent:
         messages: List[Dict[str, str]],
         system_prompt: str,
         user_context: UserContext,
-        provider: Optional[str] = None
+        provider: Optional[str] = None,
+        user_id: Optional[str] = None
     ) -> Tuple[str, List[Dict[str, str]]]:
         """
         Generate AI response with function calling support.
@@ -141,104 +319,346 @@ class AIAgent:
             system_prompt: System prompt for context
             user_context: User context for personalization
             provider: Optional provider override ("openai" or "gemini")
+            user_id: User the response is for; the semantic cache is only
+                used when it is given, and never shares entries across users
             
         Returns:
-            Tuple of (response_text, updated_messages_with_function_calls)
+            Tuple of (response_text, updated_messages_with_function_calls).
+            When no function was called this is the `messages` list itself.
             
         Requirements: 6.2, 6.3, 13.6
         """
         provider = provider or self.default_provider
+        n_msgs = len(messages)
+        has_summary = bool(user_context.userSummary)
+        hist_len = len(user_context.chatHistory)
         logger.info(
-            f"Generating response: provider={provider}, message_count={len(messages)}\n"
+            f"Generating response: provider={provider}, message_count={n_msgs}\n"
             f"User context: chatInterest={user_context.chatInterest}, "
-            f"has_summary={bool(user_context.userSummary)}, "
-            f"history_length={len(user_context.chatHistory)}"
+            f"has_summary={has_summary}, history_length={hist_len}"
         )
-        logger.debug(f"=== USER CONTEXT ===")
-        logger.debug(f"Chat Interest: {user_context.chatInterest}")
-        logger.debug(f"Topics: {user_context.topics}")
-        logger.debug(f"Birthdate: {user_context.birthdate}")
-        logger.debug(f"User Summary: {user_context.userSummary if user_context.userSummary else '(empty)'}")
-        logger.debug(f"=== END USER CONTEXT ===")
+        # Lazy: the dump is only formatted when a DEBUG sink is active
+        logger.opt(lazy=True).debug(
+            "=== USER CONTEXT ===\nChat Interest: {}\nTopics: {}\nBirthdate: {}\n"
+            "User Summary: {}\n=== END USER CONTEXT ===",
+            lambda: user_context.chatInterest,
+            lambda: user_context.topics,
+            lambda: user_context.birthdate,
+            lambda: user_context.userSummary or "(empty)"
+        )
+        
+        # Search-like turns are time-sensitive, so they bypass the response cache
+        search_query = _latest_search_query(messages)
+        cache_key = None
+        if search_query is None:
+            cache_key = self._response_cache_key("chat", provider, system_prompt, messages)
+            cached = self._response_cache_get(cache_key)
+            if cached is not None:
+                logger.info(f"Response cache hit: provider={provider}, response_length={len(cached)}")
+                return cached, messages
+        
+        semantic_scope, embedding = None, None
+        if cache_key is not None and self._semantic_cache is not None and messages and user_id:
+            # Scoped to this user and their current system prompt (which carries
+            # the conversation summary), not to the earlier turns: the history
+            # window shifts every turn, so keying on it would never hit
+            semantic_scope = (user_id, provider, _digest(system_prompt))
+            embedding = await self._semantic_embed(messages[-1])
+            if embedding is not None:
+                cached = self._semantic_cache.lookup(semantic_scope, embedding)
+                if cached is not None:
+                    logger.info(f"Semantic cache hit: provider={provider}, response_length={len(cached)}")
+                    return cached, messages
         
-        start_time = asyncio.get_event_loop().time()
+        start_time = time.perf_counter()
+        
+        # Overlap a likely web search with the first provider round-trip
+        speculative_query, speculative_search = self._start_speculative_search(search_query)
         
         try:
+            prepared = _PreparedMessages.build(messages, system_prompt)
+            
             # Call appropriate provider
             logger.debug(f"Calling {provider} provider...")
             if provider == "openai":
                 response_text, function_call = await self._call_openai(
-                    messages, system_prompt
+                    messages, system_prompt, prepared=prepared
                 )
             elif provider == "gemini":
                 response_text, function_call = await self._call_gemini(
-                    messages, system_prompt
+                    messages, system_prompt, prepared=prepared
                 )
             else:
                 raise ValueError(f"Unsupported provider: {provider}")
             
             logger.debug(f"Provider call completed: has_function_call={bool(function_call)}, response_length={len(response_text)}")
             
-            # Handle function calling if requested
-            updated_messages = messages.copy()
+            # Handle function calling if requested; without one the caller's
+            # list is returned as-is, so it is only copied when extended
+            updated_messages = messages
             
             if function_call:
                 logger.info(f"Function call requested: {function_call.get('name')} with args: {function_call.get('arguments')}")
                 
+                # Reuse the speculative search if the model asked for the same query
+                prefetched = None
+                if speculative_search is not None and self._matches_speculative_search(
+                    function_call, speculative_query
+                ):
+                    logger.debug("Reusing speculative web search results")
+                    prefetched, speculative_search = speculative_search, None
+                
                 # Execute function
                 function_result = await self._handle_function_call(
                     function_call.get("name"),
-                    function_call.get("arguments", {})
+                    function_call.get("arguments", {}),
+                    prefetched=prefetched
                 )
                 logger.debug(f"Function result length: {len(function_result)}")
                 
                 # Add function call and result to messages
-                updated_messages.append({
-                    "role": "assistant",
-                    "content": None,
-                    "function_call": function_call
-                })
-                updated_messages.append({
-                    "role": "function",
-                    "name": function_call.get("name"),
-                    "content": function_result
-                })
+                function_messages = [
+                    {
+                        "role": "assistant",
+                        "content": None,
+                        "function_call": function_call
+                    },
+                    {
+                        "role": "function",
+                        "name": function_call.get("name"),
+                        "content": function_result
+                    }
+                ]
+                updated_messages = messages + function_messages
+                prepared.extend(function_messages)
                 
                 logger.debug(f"Generating final response with function results...")
                 # Generate final response with function results
                 if provider == "openai":
                     response_text, _ = await self._call_openai(
-                        updated_messages, system_prompt
+                        updated_messages, system_prompt, prepared=prepared
                     )
                 else:
                     response_text, _ = await self._call_gemini(
-                        updated_messages, system_prompt
+                        updated_messages, system_prompt, prepared=prepared
                     )
             
-            duration = asyncio.get_event_loop().time() - start_time
+            duration = time.perf_counter() - start_time
             logger.info(
                 f"Response generated successfully: provider={provider}, duration={duration:.3f}s, "
                 f"response_length={len(response_text)}, had_function_call={bool(function_call)}"
             )
             
+            if cache_key is not None and not function_call:
+                self._response_cache_put(cache_key, response_text)
+                if embedding is not None:
+                    self._semantic_cache.store(semantic_scope, embedding, response_text)
+            
             return response_text, updated_messages
             
         except Exception as e:
-            duration = asyncio.get_event_loop().time() - start_time
+            duration = time.perf_counter() - start_time
             logger.error(
                 f"Response generation FAILED: provider={provider}, duration={duration:.3f}s\n"
                 f"Error type: {type(e).__name__}\n"
                 f"Error message: {str(e)}\n"
-                f"Message count: {len(messages)}\n"
+                f"Message count: {n_msgs}, has_summary={has_summary}, history_length={hist_len}\n"
                 f"System prompt length: {len(system_prompt)}",
                 exc_info=True
             )
             raise
+        finally:
+            # Stops waiting for an unused speculative search; the shared
+            # upstream search still completes and is cached
+            if speculative_search is not None and not speculative_search.done():
+                speculative_search.cancel()
+    
+    async def generate_response_stream(
+        self,
+        messages: List[Dict[str, str]],
+        system_prompt: str,
+        user_context: UserContext,
+        provider: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream an AI response as text chunks with function calling support.
+        
+        Streaming counterpart of generate_response for consumers that can
+        start work on partial output (TTS, websocket push). If the first
+        completion requests a function call, the function is executed and
+        only the follow-up completion is streamed.
+        
+        Args:
+            messages: List of message dicts with 'role' and 'content'
+            system_prompt: System prompt for context
+            user_context: User context for personalization
+            provider: Optional provider override ("openai" or "gemini")
+            
+        Yields:
+            Response text chunks in arrival order
+        """
+        provider = provider or self.default_provider
+        if provider == "openai":
+            stream_call = self._stream_openai
+        elif provider == "gemini":
+            stream_call = self._stream_gemini
+        else:
+            raise ValueError(f"Unsupported provider: {provider}")
+        
+        logger.info(
+            f"Streaming response: provider={provider}, message_count={len(messages)}, "
+            f"history_length={len(user_context.chatHistory)}"
+        )
+        start_time = time.perf_counter()
+        response_length = 0
+        function_call = None
+        
+        try:
+            prepared = _PreparedMessages.build(messages, system_prompt)
+            async for item in stream_call(messages, system_prompt, prepared=prepared):
+                if isinstance(item, dict):
+                    function_call = item
+                    break
+                response_length += len(item)
+                yield item
+            
+            if function_call:
+                logger.info(f"Function call requested: {function_call.get('name')} with args: {function_call.get('arguments')}")
+                function_result = await self._handle_function_call(
+                    function_call.get("name"),
+                    function_call.get("arguments", {})
+                )
+                function_messages = [
+                    {"role": "assistant", "content": None, "function_call": function_call},
+                    {"role": "function", "name": function_call.get("name"), "content": function_result}
+                ]
+                prepared.extend(function_messages)
+                
+                async for item in stream_call(messages + function_messages, system_prompt, prepared=prepared):
+                    if isinstance(item, str):
+                        response_length += len(item)
+                        yield item
+            
+            duration = time.perf_counter() - start_time
+            logger.info(
+                f"Response streamed successfully: provider={provider}, duration={duration:.3f}s, "
+                f"response_length={response_length}, had_function_call={bool(function_call)}"
+            )
+            
+        except Exception as e:
+            duration = time.perf_counter() - start_time
+            logger.error(
+                f"Response streaming FAILED: provider={provider}, duration={duration:.3f}s, "
+                f"streamed_length={response_length}\n"
+                f"Error type: {type(e).__name__}\n"
+                f"Error message: {str(e)}",
+                exc_info=True
+            )
+            raise
+    
+    @staticmethod
+    def _response_cache_key(
+        kind: str,
+        provider: str,
+        prompt: Optional[str],
+        messages: List[Dict[str, str]]
+    ) -> Tuple:
+        """Build an exact-match cache key from digests of the prompt and messages."""
+        return (
+            kind,
+            provider,
+            _digest(prompt),
+            tuple(_digest(f"{msg.get('role')}\x00{msg.get('content') or ''}") for msg in messages)
+        )
+    
+    def _response_cache_get(self, key: Tuple) -> Optional[str]:
+        """Look up a cached LLM output, refreshing its LRU position on a hit."""
+        value = self._response_cache.get(key)
+        if value is not None:
+            self._response_cache.move_to_end(key)
+        return value
+    
+    def _response_cache_put(self, key: Tuple, value: str) -> None:
+        """Store an LLM output, evicting the least recently used entry when full."""
+        if self._response_cache_size <= 0 or not value:
+            return
+        self._response_cache[key] = value
+        self._response_cache.move_to_end(key)
+        if len(self._response_cache) > self._response_cache_size:
+            self._response_cache.popitem(last=False)
+    
+    async def _embed(self, text: str) -> List[float]:
+        """Embed a text with OpenAI for the semantic response cache."""
+        response = await self.openai_client.embeddings.create(
+            model="text-embedding-3-small",
+            input=text
+        )
+        return response.data[0].embedding
+    
+    async def _semantic_embed(self, message: Dict[str, Any]) -> Optional[Tuple[float, ...]]:
+        """
+        Embed the latest user message for a semantic cache lookup.
+        
+        Returns None for non-user turns or if embedding fails, in which case
+        the request simply goes to the LLM.
+        """
+        if message.get("role") != "user" or not message.get("content"):
+            return None
+        try:
+            return await self._semantic_cache.embed(message["content"])
+        except Exception as e:
+            logger.warning(f"Semantic cache embedding failed: {type(e).__name__}: {e}")
+            return None
+    
+    def _start_speculative_search(
+        self,
+        query: Optional[str]
+    ) -> Tuple[Optional[str], Optional[asyncio.Task]]:
+        """
+        Start a web search for a search-like user turn.
+        
+        If its results are not used, generate_response cancels the task, but
+        that only abandons this caller's wait: the upstream request runs to
+        completion under SearchService's single-flight shield and fills its
+        TTL cache, so a later identical search is served from there.
+        
+        Args:
+            query: Latest user message if it looks like a search query, else None
+            
+        Returns:
+            Tuple of (query, search_task), or (None, None) if no search was started
+        """
+        if not self.search_service or query is None:
+            return None, None
+        
+        logger.debug(f"Starting speculative web search: query='{query}'")
+        task = asyncio.create_task(
+            self.search_service.search(query, _SPECULATIVE_SEARCH_COUNT)
+        )
+        task.add_done_callback(_log_discarded_search)
+        return query, task
+    
+    @staticmethod
+    def _matches_speculative_search(
+        function_call: Dict[str, Any],
+        speculative_query: Optional[str]
+    ) -> bool:
+        """Check whether a requested web_search matches the speculative one."""
+        if function_call.get("name") != "web_search" or speculative_query is None:
+            return False
+        
+        arguments = function_call.get("arguments") or {}
+        query = str(arguments.get("query", ""))
+        return (
+            query.strip().lower() == speculative_query.strip().lower()
+            and arguments.get("count", _SPECULATIVE_SEARCH_COUNT) == _SPECULATIVE_SEARCH_COUNT
+        )
     
     async def _call_openai(
         self,
         messages: List[Dict[str, str]],
-        system_prompt: str
+        system_prompt: str,
+        prepared: Optional[_PreparedMessages] = None
     ) -> Tuple[str, Optional[Dict[str, Any]]]:
         """
         Call OpenAI API with retry logic and function calling support.
@@ -246,6 +666,7 @@ class AIAgent:
         Args:
             messages: List of message dicts
             system_prompt: System prompt
+            prepared: Optional pre-translated messages from _PreparedMessages.build
             
         Returns:
             Tuple of (response_text, function_call_dict or None)
@@ -253,19 +674,18 @@ class AIAgent:
         Requirements: 6.2, 6.4, 13.6, 13.11, 11.3
         """
         logger.debug(f"Calling OpenAI API: message_count={len(messages)}")
+        prepared = prepared or _PreparedMessages.build(messages, system_prompt)
+        api_messages = prepared.openai
         
         async def _make_openai_call():
-            # Prepare messages with system prompt
-            api_messages = [{"role": "system", "content": system_prompt}]
-            api_messages.extend(messages)
-            
             # Make API call with function calling support
             response = await self.openai_client.chat.completions.create(
                 model="gpt-4o-mini",
                 messages=api_messages,
-                functions=[self.function_schema],
+                functions=_OPENAI_FUNCTIONS,
                 function_call="auto",
-                temperature=0.7
+                temperature=0.7,
+                extra_body={"prompt_cache_key": prepared.prompt_cache_key}
             )
             
             return response
@@ -293,10 +713,9 @@ class AIAgent:
         # Check for function call
         function_call = None
         if hasattr(message, 'function_call') and message.function_call:
-            import json
             function_call = {
                 "name": message.function_call.name,
-                "arguments": json.loads(message.function_call.arguments)
+                "arguments": orjson.loads(message.function_call.arguments)
             }
             return "", function_call
         
@@ -305,7 +724,8 @@ class AIAgent:
     async def _call_gemini(
         self,
         messages: List[Dict[str, str]],
-        system_prompt: str
+        system_prompt: str,
+        prepared: Optional[_PreparedMessages] = None
     ) -> Tuple[str, Optional[Dict[str, Any]]]:
         """
         Call Google Gemini API with retry logic and function calling support.
@@ -313,6 +733,7 @@ class AIAgent:
         Args:
             messages: List of message dicts
             system_prompt: System prompt
+            prepared: Optional pre-translated messages from _PreparedMessages.build
             
         Returns:
             Tuple of (response_text, function_call_dict or None)
@@ -321,82 +742,29 @@ class AIAgent:
         """
         logger.debug(f"Calling Gemini API: message_count={len(messages)}")
         logger.debug(f"System prompt length: {len(system_prompt)}")
-        logger.debug(f"Messages structure: {[{k: v for k, v in msg.items() if k != 'content'} for msg in messages]}")
+        logger.opt(lazy=True).debug(
+            "Messages structure: {}",
+            lambda: [{k: v for k, v in msg.items() if k != "content"} for msg in messages]
+        )
         
         async def _make_gemini_call():
             try:
-                logger.debug("Building function declaration for Gemini")
-                # Define function declaration using dict format
-                # Define function declaration using Gemini's schema format
-                # Gemini uses TYPE_STRING, TYPE_INTEGER instead of "string", "integer"
-                function_declaration = {
-                    "name": self.function_schema["name"],
-                    "description": self.function_schema["description"],
-                    "parameters": {
-                        "type_": "OBJECT",
-                        "properties": {
-                            "query": {
-                                "type_": "STRING",
-                                "description": self.function_schema["parameters"]["properties"]["query"]["description"]
-                            },
-                            "count": {
-                                "type_": "INTEGER",
-                                "description": self.function_schema["parameters"]["properties"]["count"]["description"]
-                            }
-                        },
-                        "required": ["query"]
-                    }
-                }
-                logger.debug(f"Function declaration created: {function_declaration}")
-                
-                # Initialize model with function declarations
-                logger.debug("Initializing Gemini model: models/gemini-2.5-flash")
-                model = genai.GenerativeModel(
-                    model_name="models/gemini-2.5-flash",
-                    tools=[function_declaration]
-                )
-                logger.debug("Gemini model initialized successfully")
-                
-                # Convert messages to Gemini format, prepending system prompt as first user message
-                gemini_messages = []
-                
-                # Add system prompt as first user message
-                logger.debug("Adding system prompt to messages")
-                gemini_messages.append({
-                    "role": "user",
-                    "parts": [system_prompt]
-                })
-                
-                gemini_messages.append({
-                    "role": "model",
-                    "parts": ["Understood. I'll follow these instructions."]
-                })
-                # Add conversation messages
-                logger.debug(f"Converting {len(messages)} messages to Gemini format")
-                for idx, msg in enumerate(messages):
-                    role = "user" if msg["role"] == "user" else "model"
-                    content = msg.get("content", "")
-                    logger.debug(f"Message {idx}: role={msg['role']}, has_content={bool(content)}, content_length={len(content) if content else 0}")
-                    if content:  # Skip empty content
-                        gemini_messages.append({
-                            "role": role,
-                            "parts": [content]
-                        })
+                # Gemini format: system prompt as first user message, empty content skipped
+                gemini_messages = (prepared or _PreparedMessages.build(messages, system_prompt)).gemini
                 
                 logger.debug(f"Final Gemini messages count: {len(gemini_messages)}")
-                logger.debug(f"Gemini messages structure: {[{'role': m['role'], 'parts_count': len(m.get('parts', []))} for m in gemini_messages]}")
+                logger.opt(lazy=True).debug(
+                    "Gemini messages structure: {}",
+                    lambda: [{"role": m["role"], "parts_count": len(m.get("parts", []))} for m in gemini_messages]
+                )
                 
                 # Generate response
                 logger.debug("Calling Gemini API generate_content_async...")
-                response = await model.generate_content_async(
+                response = await self._gemini_model.generate_content_async(
                     gemini_messages,
-                    generation_config=genai.types.GenerationConfig(
-                        temperature=0.7
-                    )
+                    generation_config=self._gemini_generation_config
                 )
                 logger.debug("Gemini API call completed successfully")
-                logger.debug(f"Response type: {type(response)}")
-                logger.debug(f"Response attributes: {dir(response)}")
                 
                 return response
                 
@@ -434,52 +802,149 @@ class AIAgent:
         except Exception as e:
             logger.warning(f"Failed to log token usage: {e}")
         
-        # Check for function call
+        # Single walk over the parts: a function call wins, otherwise join the text
         try:
-            logger.debug(f"Checking for function calls in response")
-            logger.debug(f"Response has candidates: {hasattr(response, 'candidates')}")
-            if hasattr(response, 'candidates'):
-                logger.debug(f"Candidates count: {len(response.candidates) if response.candidates else 0}")
-                
             if response.candidates and response.candidates[0].content.parts:
-                logger.debug(f"Parts count: {len(response.candidates[0].content.parts)}")
-                for idx, part in enumerate(response.candidates[0].content.parts):
-                    logger.debug(f"Part {idx} type: {type(part)}, attributes: {dir(part)}")
-                    if hasattr(part, 'function_call') and part.function_call:
-                        logger.info(f"Function call detected: {part.function_call.name}")
-                        function_call = {
-                            "name": part.function_call.name,
-                            "arguments": dict(part.function_call.args)
+                parts = response.candidates[0].content.parts
+                for part in parts:
+                    function_call = getattr(part, "function_call", None)
+                    if function_call:
+                        logger.info(f"Function call detected: {function_call.name}")
+                        return "", {
+                            "name": function_call.name,
+                            "arguments": dict(function_call.args)
                         }
-                        logger.debug(f"Function call arguments: {function_call['arguments']}")
-                        return "", function_call
-        except Exception as e:
-            logger.error(f"Error checking for function calls: {type(e).__name__}: {str(e)}", exc_info=True)
-        
-        # Extract text response
-        try:
-            logger.debug("Extracting text response from Gemini")
-            if response.candidates and response.candidates[0].content.parts:
-                text_parts = [
-                    part.text for part in response.candidates[0].content.parts
-                    if hasattr(part, 'text')
-                ]
-                logger.debug(f"Extracted {len(text_parts)} text parts, total length: {sum(len(p) for p in text_parts)}")
-                result = "".join(text_parts)
+                
+                result = "".join(part.text for part in parts if getattr(part, "text", None))
                 logger.debug(f"Final response length: {len(result)}")
                 return result, None
             else:
                 logger.warning("No candidates or parts found in response")
         except Exception as e:
-            logger.error(f"Error extracting text response: {type(e).__name__}: {str(e)}", exc_info=True)
+            logger.error(f"Error processing Gemini response: {type(e).__name__}: {str(e)}", exc_info=True)
         
         logger.warning("Returning empty response from Gemini")
         return "", None
     
+    async def _stream_openai(
+        self,
+        messages: List[Dict[str, str]],
+        system_prompt: str,
+        prepared: Optional[_PreparedMessages] = None
+    ) -> AsyncIterator[Union[str, Dict[str, Any]]]:
+        """
+        Stream an OpenAI completion.
+        
+        Args:
+            messages: List of message dicts
+            system_prompt: System prompt
+            prepared: Optional pre-translated messages from _PreparedMessages.build
+            
+        Yields:
+            Text deltas as they arrive, or a single function_call dict once
+            the stream ends if the model requested a function call
+        """
+        logger.debug(f"Streaming OpenAI API: message_count={len(messages)}")
+        
+        prepared = prepared or _PreparedMessages.build(messages, system_prompt)
+        api_messages = prepared.openai
+        
+        async def _open_openai_stream():
+            return await self.openai_client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=api_messages,
+                functions=_OPENAI_FUNCTIONS,
+                function_call="auto",
+                temperature=0.7,
+                stream=True,
+                extra_body={"prompt_cache_key": prepared.prompt_cache_key}
+            )
+        
+        # Retry only covers opening the stream; a broken stream mid-way is surfaced
+        stream = await retry_with_backoff(
+            _open_openai_stream,
+            max_retries=3,
+            base_delay=1.0,
+            max_delay=10.0
+        )
+        
+        # Function call names and arguments arrive as deltas across chunks
+        function_name = None
+        argument_parts = []
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.function_call:
+                if delta.function_call.name:
+                    function_name = delta.function_call.name
+                if delta.function_call.arguments:
+                    argument_parts.append(delta.function_call.arguments)
+            elif delta.content:
+                yield delta.content
+        
+        if function_name:
+            yield {
+                "name": function_name,
+                "arguments": orjson.loads("".join(argument_parts) or "{}")
+            }
+    
+    async def _stream_gemini(
+        self,
+        messages: List[Dict[str, str]],
+        system_prompt: str,
+        prepared: Optional[_PreparedMessages] = None
+    ) -> AsyncIterator[Union[str, Dict[str, Any]]]:
+        """
+        Stream a Gemini completion.
+        
+        Args:
+            messages: List of message dicts
+            system_prompt: System prompt
+            prepared: Optional pre-translated messages from _PreparedMessages.build
+            
+        Yields:
+            Text chunks as they arrive, or a single function_call dict if the
+            model requested a function call
+        """
+        logger.debug(f"Streaming Gemini API: message_count={len(messages)}")
+        
+        gemini_messages = (prepared or _PreparedMessages.build(messages, system_prompt)).gemini
+        
+        async def _open_gemini_stream():
+            return await self._gemini_model.generate_content_async(
+                gemini_messages,
+                generation_config=self._gemini_generation_config,
+                stream=True
+            )
+        
+        stream = await retry_with_backoff(
+            _open_gemini_stream,
+            max_retries=3,
+            base_delay=1.0,
+            max_delay=10.0,
+            operation_name="_open_gemini_stream"
+        )
+        
+        async for chunk in stream:
+            if not chunk.candidates or not chunk.candidates[0].content.parts:
+                continue
+            for part in chunk.candidates[0].content.parts:
+                if getattr(part, "function_call", None):
+                    yield {
+                        "name": part.function_call.name,
+                        "arguments": dict(part.function_call.args)
+                    }
+                    return
+                text = getattr(part, "text", "")
+                if text:
+                    yield text
+    
     async def _handle_function_call(
         self,
         function_name: str,
-        arguments: Dict[str, Any]
+        arguments: Dict[str, Any],
+        prefetched: Optional[asyncio.Task] = None
     ) -> str:
         """
         Execute function calls (e.g., web search).
@@ -490,6 +955,8 @@ class AIAgent:
         Args:
             function_name: Name of the function to call
             arguments: Function arguments dict
+            prefetched: Optional already-running search task to await instead
+                of issuing a new web search
             
         Returns:
             Formatted function result as string
@@ -507,21 +974,22 @@ class AIAgent:
                 query = arguments.get("query", "")
                 count = arguments.get("count", 5)
                 
-                # Perform search
-                results = await self.search_service.search(query, count)
+                # Perform search (or pick up the speculative one)
+                if prefetched is not None:
+                    results = await prefetched
+                else:
+                    results = await self.search_service.search(query, count)
                 
                 if not results:
                     return f"No search results found for query: {query}"
                 
                 # Format results for LLM
-                formatted_results = [
-                    f"**{i+1}. {result['title']}**\n"
+                return "Search results:\n\n" + "\n".join(
+                    f"**{i}. {result['title']}**\n"
                     f"URL: {result['url']}\n"
                     f"Description: {result['description']}\n"
-                    for i, result in enumerate(results)
-                ]
-                
-                return "Search results:\n\n" + "\n".join(formatted_results)
+                    for i, result in enumerate(results, 1)
+                )
             
             else:
                 logger.warning(f"Unknown function: {function_name}")
@@ -593,6 +1061,12 @@ class AIAgent:
             }
         ]
         
+        cache_key = self._response_cache_key("summary", provider, system_prompt, summarization_messages)
+        cached = self._response_cache_get(cache_key)
+        if cached is not None:
+            logger.info(f"Summary cache hit: length={len(cached)}")
+            return cached
+        
         try:
             # Generate summary
             if provider == "openai":
@@ -607,6 +1081,7 @@ class AIAgent:
                 )
             
             logger.info(f"Summary generated: length={len(summary)}")
+            self._response_cache_put(cache_key, summary)
             return summary
             
         except Exception as e:
@@ -615,3 +1090,38 @@ class AIAgent:
             if previous_summary:
                 return f"{previous_summary}\n\nAdditional {len(messages)} messages discussed."
             return f"Previous conversation covered {len(messages)} messages."
+    
+    async def summarize_messages_batch(
+        self,
+        items: List[Tuple[List[Dict[str, str]], Optional[str]]],
+        provider: Optional[str] = None,
+        concurrency: int = 16
+    ) -> List[str]:
+        """
+        Summarize several conversations concurrently.
+        
+        Intended for background compression jobs that handle many users at
+        once. Each item is summarized exactly as summarize_messages would,
+        with at most `concurrency` provider calls in flight to stay within
+        rate limits.
+        
+        Args:
+            items: List of (messages, previous_summary) tuples
+            provider: Optional provider override
+            concurrency: Maximum number of concurrent summarization calls
+            
+        Returns:
+            Summaries in the same order as items
+        """
+        logger.info(f"Summarizing batch: size={len(items)}, concurrency={concurrency}")
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        
+        async def _summarize(messages: List[Dict[str, str]], previous_summary: Optional[str]) -> str:
+            async with semaphore:
+                return await self.summarize_messages(messages, previous_summary, provider)
+        
+        # summarize_messages falls back to a basic summary on failure, so one
+        # failing conversation never aborts the batch
+        return list(await asyncio.gather(
+            *(_summarize(messages, previous_summary) for messages, previous_summary in items)
+        ))
@@ -1,34 +1,110 @@
 """Cache manager using DiskCache for user context storage."""
 
-from diskcache import Cache
-from typing import Optional
+from collections import OrderedDict
+from diskcache import Disk, FanoutCache
+from diskcache.core import MODE_BINARY, MODE_RAW, UNKNOWN
+from typing import Any, Dict, Optional, Tuple
 from loguru import logger
 import asyncio
+import orjson
+import time
+from functools import partial
+from app.executors import IO_POOL
 from app.models import UserContext, Message
 
 
+class OrjsonDisk(Disk):
+    """
+    DiskCache serializer that stores values as orjson bytes instead of pickle.
+    
+    Keys keep DiskCache's default encoding. Rows written by the default
+    pickle disk are still readable, since only raw/binary rows are decoded.
+    """
+    
+    def store(self, value, read, key=UNKNOWN):
+        if not read:
+            value = orjson.dumps(value)
+        return super().store(value, read, key=key)
+    
+    def fetch(self, mode, filename, value, read):
+        data = super().fetch(mode, filename, value, read)
+        if not read and mode in (MODE_RAW, MODE_BINARY):
+            data = orjson.loads(data)
+        return data
+
+
+def _copy_context(context: UserContext) -> UserContext:
+    """
+    Copy a context so that in-place edits to one copy do not affect the other.
+    
+    Messages are frozen, so copying the lists is enough.
+    """
+    return context.model_copy(update={
+        "chatHistory": list(context.chatHistory),
+        "topics": list(context.topics)
+    })
+
+
 class CacheManager:
     """
     Manages user context caching with TTL support using DiskCache.
     
     Provides async wrapper around DiskCache operations with comprehensive
-    logging for cache hits, misses, and TTL expiry events.
+    logging for cache hits, misses, and TTL expiry events. Entries are
+    sharded across several SQLite files so writes for different users do
+    not serialize on a single database lock.
     
     Requirements: 2.1, 2.2, 2.3, 2.4, 2.5, 13.4, 11.2
     """
     
-    def __init__(self, cache_dir: str, ttl: int):
+    def __init__(
+        self,
+        cache_dir: str,
+        ttl: int,
+        l1_size: int = 1024,
+        shards: int = 8,
+        l1_ttl: float = 5.0
+    ):
         """
         Initialize cache manager.
         
         Args:
             cache_dir: Directory path for DiskCache storage
             ttl: Time-to-live in seconds for cached entries
+            l1_size: Maximum number of deserialized contexts kept in the
+                in-process LRU in front of DiskCache (0 disables it)
+            shards: Number of SQLite shards the entries are hashed across
+            l1_ttl: Seconds an L1 entry is served before DiskCache is read
+                again, bounding staleness when other workers write the user
         """
-        self.cache = Cache(cache_dir)
+        # A shard that stays locked past the timeout makes the operation
+        # give up (get misses, set returns False) instead of blocking
+        self.cache = FanoutCache(cache_dir, shards=shards, timeout=1, disk=OrjsonDisk)
         self.ttl = ttl
+        
+        # L1: user_id -> (monotonic expiry, UserContext), most recently used last.
+        # Holds private copies, so callers mutating a context cannot change it
+        self._l1: "OrderedDict[str, Tuple[float, UserContext]]" = OrderedDict()
+        self._l1_size = l1_size
+        self._l1_ttl = min(l1_ttl, ttl)
+        
+        # Write-behind: latest unwritten cache data per user, in arrival order.
+        # A single drain task flushes it to DiskCache off the request path.
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._writer_task: Optional[asyncio.Task] = None
+        self._write_lock = asyncio.Lock()
         logger.info(f"CacheManager initialized: directory={cache_dir}, ttl={ttl}s")
     
+    async def warmup(self) -> None:
+        """
+        Open the cache shards and start the I/O threads before the first request.
+        
+        Should be called during application startup.
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(IO_POOL, self.cache.get, "__warmup__")
+        logger.info("CacheManager warmed up")
+    
     async def get(self, user_id: str) -> Optional[UserContext]:
         """
         Get user context from cache.
@@ -44,9 +120,22 @@ class CacheManager:
             
         Requirements: 2.2, 13.4
         """
-        # Run blocking cache operation in thread pool
-        loop = asyncio.get_event_loop()
-        cache_data = await loop.run_in_executor(None, self.cache.get, user_id)
+        entry = self._l1.get(user_id)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._l1.move_to_end(user_id)
+                logger.info(f"Cache hit for user_id={user_id} (L1)")
+                return _copy_context(entry[1])
+            del self._l1[user_id]
+        
+        # Unflushed writes are newer than anything on disk. Otherwise DiskCache
+        # is always read: other workers sharing the directory may have written
+        # the user, so this process cannot decide a miss from its own keys
+        cache_data = self._pending.get(user_id)
+        if cache_data is None:
+            # Run blocking cache operation in thread pool
+            loop = asyncio.get_running_loop()
+            cache_data = await loop.run_in_executor(IO_POOL, self.cache.get, user_id)
         
         if cache_data is None:
             logger.info(f"Cache miss for user_id={user_id}")
@@ -56,20 +145,24 @@ class CacheManager:
         logger.info(f"Cache hit for user_id={user_id}")
         
         try:
-            # Convert dict back to UserContext
-            user_context = UserContext(**cache_data)
-            return user_context
+            # Convert cache payload back to UserContext
+            user_context = UserContext.from_cache(cache_data)
         except Exception as e:
             logger.error(f"Failed to deserialize cached data for user_id={user_id}: {e}")
             # Delete corrupted cache entry
             await self.delete(user_id)
             return None
+        
+        self._l1_put(user_id, user_context)
+        return user_context
     
     async def set(self, user_id: str, context: UserContext) -> None:
         """
         Set user context in cache with TTL.
         
-        Stores user context with configured TTL. Logs the operation.
+        Stores user context with configured TTL. The context is visible to
+        get() immediately; the DiskCache write happens in a background task,
+        and repeated sets for a user before it runs are coalesced.
         
         Args:
             user_id: Unique user identifier
@@ -77,17 +170,50 @@ class CacheManager:
             
         Requirements: 2.4, 13.4
         """
-        # Convert UserContext to dict for storage
-        cache_data = context.model_dump()
+        self._l1_put(user_id, context)
         
-        # Run blocking cache operation in thread pool
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(
-            None,
-            lambda: self.cache.set(user_id, cache_data, expire=self.ttl)
-        )
+        # Convert UserContext to a plain payload for storage
+        self._pending.pop(user_id, None)
+        self._pending[user_id] = context.to_cache()
+        
+        if self._writer_task is None or self._writer_task.done():
+            self._writer_task = asyncio.create_task(self._drain_writes())
+        
+        logger.debug(f"Cache set queued for user_id={user_id}, pending={len(self._pending)}")
+    
+    async def _drain_writes(self) -> None:
+        """Write pending entries to DiskCache until none are left."""
+        loop = asyncio.get_running_loop()
+        while self._pending:
+            async with self._write_lock:
+                if not self._pending:
+                    break
+                user_id, cache_data = next(iter(self._pending.items()))
+                try:
+                    stored = await loop.run_in_executor(
+                        IO_POOL,
+                        partial(self.cache.set, user_id, cache_data, expire=self.ttl)
+                    )
+                    if stored:
+                        logger.info(f"Cache set for user_id={user_id}, ttl={self.ttl}s")
+                    else:
+                        logger.warning(f"Cache set timed out for user_id={user_id}")
+                except Exception as e:
+                    logger.error(f"Background cache write failed for user_id={user_id}: {e}")
+                
+                # Keep the entry if a newer set arrived while writing
+                if self._pending.get(user_id) is cache_data:
+                    del self._pending[user_id]
+    
+    async def flush(self) -> None:
+        """
+        Wait until all queued cache writes have reached DiskCache.
         
-        logger.info(f"Cache set for user_id={user_id}, ttl={self.ttl}s")
+        Called by close(); also useful before reading DiskCache directly.
+        """
+        task = self._writer_task
+        if task is not None and not task.done():
+            await task
     
     async def delete(self, user_id: str) -> None:
         """
@@ -100,57 +226,56 @@ class CacheManager:
             
         Requirements: 2.3, 13.4
         """
-        # Run blocking cache operation in thread pool
-        loop = asyncio.get_event_loop()
-        deleted = await loop.run_in_executor(None, self.cache.delete, user_id)
+        self._l1.pop(user_id, None)
+        
+        # Hold the write lock so an in-flight background write cannot land
+        # after the delete
+        async with self._write_lock:
+            self._pending.pop(user_id, None)
+            
+            # Run blocking cache operation in thread pool
+            loop = asyncio.get_running_loop()
+            deleted = await loop.run_in_executor(IO_POOL, self.cache.delete, user_id)
         
         if deleted:
             logger.info(f"Cache deleted for user_id={user_id}")
         else:
             logger.debug(f"Cache delete called for non-existent user_id={user_id}")
     
-    async def check_and_summarize(
-        self,
-        user_id: str,
+    def _l1_put(self, user_id: str, context: UserContext) -> None:
+        """Store a copy of a context in the L1 LRU, evicting the least recently used entry when full."""
+        if self._l1_size <= 0:
+            return
+        # Short TTL: other workers may update the user on disk meanwhile
+        self._l1[user_id] = (time.monotonic() + self._l1_ttl, _copy_context(context))
+        self._l1.move_to_end(user_id)
+        if len(self._l1) > self._l1_size:
+            self._l1.popitem(last=False)
+    
+    @staticmethod
+    def needs_summarization(
         context: UserContext,
         max_messages: int,
         overlap: int
-    ) -> tuple[bool, UserContext]:
+    ) -> bool:
         """
-        Check if summarization is needed and return updated context.
+        Check if chat history has grown past the summarization threshold.
         
-        Determines if chat history exceeds the threshold and needs summarization.
         Does not perform the actual summarization (that's done by AI agent),
-        but detects when it's needed.
+        but detects when it's needed. Pure check with no I/O, so it is a
+        plain function rather than a coroutine.
         
         Args:
-            user_id: Unique user identifier
             context: Current user context
             max_messages: Maximum number of messages to retain (PREVIOUS_MESSAGE_CONTEXT_LENGTH)
             overlap: Overlap count for summarization threshold
             
         Returns:
-            Tuple of (needs_summarization, context)
-            - needs_summarization: True if summarization should be triggered
-            - context: The same context passed in (unchanged)
+            True if summarization should be triggered
             
         Requirements: 2.5, 11.2
         """
-        current_message_count = len(context.chatHistory)
-        threshold = max_messages + overlap
-        
-        if current_message_count > threshold:
-            logger.info(
-                f"Summarization needed for user_id={user_id}: "
-                f"message_count={current_message_count}, threshold={threshold}"
-            )
-            return True, context
-        else:
-            logger.debug(
-                f"No summarization needed for user_id={user_id}: "
-                f"message_count={current_message_count}, threshold={threshold}"
-            )
-            return False, context
+        return len(context.chatHistory) > max_messages + overlap
     
     async def cleanup_expired(self) -> int:
         """
@@ -164,8 +289,14 @@ class CacheManager:
             
         Requirements: 2.3, 11.2
         """
-        loop = asyncio.get_event_loop()
-        count = await loop.run_in_executor(None, self.cache.expire)
+        # DiskCache already expires rows in small batches, each in its own
+        # transaction, so the write lock is only held briefly at a time. The
+        # fanout cache sweeps every shard against one cutoff taken at the
+        # start, and retry=True retries batches on lock timeouts instead of failing
+        loop = asyncio.get_running_loop()
+        count = await loop.run_in_executor(
+            IO_POOL, partial(self.cache.expire, retry=True)
+        )
         logger.info(f"Cache cleanup: removed {count} expired entries")
         return count
     
@@ -173,8 +304,10 @@ class CacheManager:
         """
         Close the cache and cleanup resources.
         
-        Should be called during application shutdown.
+        Flushes queued writes first. Should be called during application shutdown.
         """
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, self.cache.close)
+        await self.flush()
+        self._l1.clear()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(IO_POOL, self.cache.close)
         logger.info("CacheManager closed")
@@ -2,7 +2,7 @@
 
 from pydantic_settings import BaseSettings
 from functools import lru_cache
-from typing import Optional
+from typing import List, Optional
 
 
 class Settings(BaseSettings):
@@ -19,18 +19,32 @@ class Settings(BaseSettings):
     appwrite_api_key: str
     appwrite_database_id: str
     appwrite_collection_id: str
+    appwrite_write_debounce_seconds: float = 0.0  # 0 writes chat history immediately
     
     # LLM Providers
     openai_api_key: str
     gemini_api_key: str
     default_llm_provider: str = "openai"
+    # Reuse responses to near-duplicate messages at or above this cosine
+    # similarity (e.g. 0.9); unset disables the semantic cache
+    semantic_cache_threshold: Optional[float] = None
     
     # Brave Search
     brave_api_key: str
     
+    # Outbound HTTP connection pools (search and OpenAI clients)
+    http_max_connections: int = 100
+    http_max_keepalive_connections: int = 50
+    
     # DiskCache
     cache_directory: str = "./cache"
     
+    # Rate limiting (shared across workers when set, e.g. redis://localhost:6379/0)
+    redis_url: Optional[str] = None
+    
+    # CORS (JSON list in the environment, e.g. ["https://app.example.com"])
+    cors_origins: List[str] = ["*"]
+    
     # Logging
     log_level: str = "INFO"
     log_rotation: str = "100 MB"
@@ -1,13 +1,23 @@
 """Database service for Appwrite integration."""
 
 from appwrite.client import Client
+from appwrite.encoders.value_class_encoder import ValueClassEncoder
 from appwrite.services.databases import Databases
 from appwrite.exception import AppwriteException
-from typing import Optional, List, Dict
+from appwrite.query import Query
+from collections import OrderedDict
+from typing import Any, Optional, List, Dict
 from loguru import logger
 import asyncio
-from functools import wraps
+import json
+import threading
+import time
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+from functools import partial, wraps
 
+from app.executors import IO_POOL
 from app.models import UserContext, Message
 from app.utils import retry_with_backoff
 
@@ -21,11 +31,156 @@ def async_appwrite(func):
     """
     @wraps(func)
     async def wrapper(*args, **kwargs):
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, lambda: func(*args, **kwargs))
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(IO_POOL, partial(func, *args, **kwargs))
     return wrapper
 
 
+class _PooledClient(Client):
+    """
+    Appwrite Client that sends requests over a per-thread keep-alive Session.
+    
+    Client.call() goes through module-level requests.request(), which opens a
+    fresh connection for every call. This mirrors call() for the JSON and
+    body-less requests the Databases service makes, sending them through a
+    Session owned by the calling I/O thread (requests.Session is not
+    thread-safe). Multipart uploads are left to the SDK.
+    """
+    
+    def __init__(self):
+        super().__init__()
+        self._local = threading.local()
+    
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            # A thread sends one request at a time, so one pooled connection is enough
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=0)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            self._local.session = session
+        return session
+    
+    def call(self, method, path='', headers=None, params=None, response_type='json'):
+        merged_headers = {**self._global_headers, **(headers or {})}
+        content_type = merged_headers.get("content-type", "")
+        if content_type.startswith("multipart/form-data"):
+            return super().call(method, path, headers, params, response_type)
+        
+        params = params or {}
+        data = {}
+        if method != "get":
+            data, params = params, {}
+        if content_type.startswith("application/json"):
+            data = json.dumps(data, cls=ValueClassEncoder)
+        
+        response = None
+        try:
+            response = self._session().request(
+                method=method,
+                url=self._endpoint + path,
+                params=self.flatten(params),
+                data=data,
+                headers=merged_headers,
+                verify=not self._self_signed,
+                allow_redirects=response_type != "location"
+            )
+            response.raise_for_status()
+            
+            warnings = response.headers.get("x-appwrite-warning")
+            if warnings:
+                for warning in warnings.split(";"):
+                    logger.warning(f"Appwrite warning: {warning}")
+            
+            if response_type == "location":
+                return response.headers.get("Location")
+            if response.headers["Content-Type"].startswith("application/json"):
+                return response.json()
+            return response.content
+        except Exception as e:
+            if response is None:
+                raise AppwriteException(e)
+            if response.headers.get("Content-Type", "").startswith("application/json"):
+                body = response.json()
+                raise AppwriteException(body["message"], response.status_code, body.get("type"), response.text)
+            raise AppwriteException(response.text, response.status_code, None, response.text)
+
+
+def encode_chat_history(messages: List[Message]) -> List[str]:
+    """
+    Encode chat history for the Appwrite chatHistory string array.
+    
+    Each message is serialized with orjson into its own element, so no
+    element grows with the length of the history and Appwrite's per-element
+    string size limit only has to fit a single message.
+    """
+    return [orjson.dumps({"role": msg.role, "content": msg.content}).decode() for msg in messages]
+
+
+def decode_chat_history(raw_history: Optional[List[Any]]) -> List[Dict[str, Any]]:
+    """
+    Decode an Appwrite chatHistory array into message dicts.
+    
+    Accepts the one-JSON-string-per-message layout written by
+    encode_chat_history, plain dicts, and elements holding a JSON array of
+    messages (documents written while history was stored as a single blob).
+    """
+    messages = []
+    for entry in raw_history or ():
+        if isinstance(entry, (str, bytes)):
+            entry = orjson.loads(entry)
+        if isinstance(entry, list):
+            messages.extend(entry)
+        else:
+            messages.append(entry)
+    return messages
+
+
+def _parse_chat_history(raw_history: Optional[List[Any]]) -> List[Message]:
+    """
+    Decode Appwrite chatHistory entries into Messages.
+    
+    The documents are written by this service, so messages are built with
+    model_construct instead of being re-validated.
+    """
+    return [
+        Message.model_construct(role=msg.get("role", "user"), content=msg.get("content", ""))
+        for msg in decode_chat_history(raw_history)
+    ]
+
+
+def _format_history(chat_history: List[Any]) -> str:
+    """Render chat history entries (Messages, dicts or JSON strings) for debug logs."""
+    if chat_history and not isinstance(chat_history[0], Message):
+        chat_history = decode_chat_history(chat_history)
+    lines = []
+    for idx, msg in enumerate(chat_history):
+        if isinstance(msg, Message):
+            role, content = msg.role, msg.content
+        else:
+            role, content = msg.get("role", "unknown"), msg.get("content", "")
+        lines.append(f"  [{idx}] {role}: {content}")
+    return "\n".join(lines)
+
+
+def _user_document(
+    chat_history: List[Any],
+    chat_interest: Optional[str],
+    user_summary: str,
+    birthdate: Optional[str],
+    topics: Optional[List[str]]
+) -> Dict[str, Any]:
+    """Build a complete Appwrite user document from already-encoded chat history."""
+    return {
+        "chatHistory": chat_history,
+        "chatInterest": chat_interest,
+        "userSummary": user_summary,
+        "birthdate": birthdate,
+        "topics": list(topics or [])
+    }
+
+
 class DatabaseService:
     """
     Service for managing user data in Appwrite database.
@@ -42,7 +197,9 @@ class DatabaseService:
         project_id: str,
         api_key: str,
         database_id: str,
-        collection_id: str
+        collection_id: str,
+        write_debounce: float = 0.0,
+        written_cache_size: int = 4096
     ):
         """
         Initialize Appwrite database service.
@@ -53,8 +210,12 @@ class DatabaseService:
             api_key: Appwrite API key for authentication
             database_id: Database ID in Appwrite
             collection_id: Collection ID for user data
+            write_debounce: Seconds to coalesce chat history updates per user
+                before writing to Appwrite (0 writes immediately)
+            written_cache_size: Number of users whose last written fields are
+                remembered so unchanged fields can be left out of updates
         """
-        self.client = Client()
+        self.client = _PooledClient()
         self.client.set_endpoint(endpoint)
         self.client.set_project(project_id)
         self.client.set_key(api_key)
@@ -63,10 +224,42 @@ class DatabaseService:
         self.database_id = database_id
         self.collection_id = collection_id
         
+        # Debounced chat history updates: latest pending update and flush timer per user
+        self.write_debounce = write_debounce
+        self._pending_updates: Dict[str, Dict[str, Any]] = {}
+        self._flush_tasks: Dict[str, asyncio.Task] = {}
+        
+        # Last fields this process wrote per user, most recently written last
+        self._written: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._written_cache_size = written_cache_size
+        
         logger.info(
             f"DatabaseService initialized"
         )
 
+    async def warmup(self) -> None:
+        """
+        Open a keep-alive HTTPS connection to Appwrite before the first request.
+        
+        Issues a one-document list query. Failures are logged and ignored so
+        an unreachable Appwrite does not block startup.
+        """
+        start_time = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(
+                IO_POOL,
+                partial(
+                    self.databases.list_documents,
+                    self.database_id,
+                    self.collection_id,
+                    queries=[Query.limit(1)]
+                )
+            )
+            logger.info(f"DatabaseService warmed up in {time.perf_counter() - start_time:.3f}s")
+        except Exception as e:
+            logger.warning(f"DatabaseService warmup failed: {e}")
+    
     async def get_user_context(self, user_id: str) -> Optional[UserContext]:
         """
         Fetch user context from Appwrite database.
@@ -86,7 +279,7 @@ class DatabaseService:
         Requirements: 2.3, 4.2, 13.5, 11.1
         """
         logger.info(f"Fetching user context for user_id={user_id} from Appwrite database")
-        start_time = asyncio.get_event_loop().time()
+        start_time = time.perf_counter()
         
         try:
             # Wrap synchronous Appwrite call with retry logic
@@ -95,59 +288,54 @@ class DatabaseService:
             coll_id = self.collection_id
             doc_id = user_id
             
+            def _sync_fetch():
+                # Decode the history on the I/O thread too, keeping the
+                # per-message parsing off the event loop
+                document = self.databases.get_document(db_id, coll_id, doc_id)
+                return document, _parse_chat_history(document.get("chatHistory"))
+            
             async def _fetch():
                 logger.debug(
                     f"Calling Appwrite get_document: database_id={db_id}, "
                     f"collection_id={coll_id}, document_id={doc_id}"
                 )
-                loop = asyncio.get_event_loop()
-                
-                def _sync_call():
-                    return self.databases.get_document(db_id, coll_id, doc_id)
-                
-                return await loop.run_in_executor(None, _sync_call)
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(IO_POOL, _sync_fetch)
             
-            document = await retry_with_backoff(_fetch, operation_name="get_user_context")
+            document, chat_history = await retry_with_backoff(_fetch, operation_name="get_user_context")
             
-            duration = asyncio.get_event_loop().time() - start_time
+            duration = time.perf_counter() - start_time
             logger.info(
                 f"User context retrieved for user_id={user_id} in {duration:.3f}s"
             )
             
-            # Parse document into UserContext
-            import json
-            chat_history = []
-            if "chatHistory" in document and document["chatHistory"]:
-                for msg_str in document["chatHistory"]:
-                    # Parse JSON string back to dict
-                    msg = json.loads(msg_str) if isinstance(msg_str, str) else msg_str
-                    chat_history.append(Message(
-                        role=msg.get("role", "user"),
-                        content=msg.get("content", "")
-                    ))
-            
-            context = UserContext(
+            # Build UserContext from the already-parsed history
+            context = UserContext.model_construct(
                 chatHistory=chat_history,
                 chatInterest=document.get("chatInterest"),
                 userSummary=document.get("userSummary", ""),
                 birthdate=document.get("birthdate"),
-                topics=document.get("topics", [])
+                topics=document.get("topics") or []
             )
             
-            logger.debug(f"=== FETCHED USER CONTEXT (user_id={user_id}) ===")
-            logger.debug(f"Chat Interest: {context.chatInterest}")
-            logger.debug(f"Topics: {context.topics}")
-            logger.debug(f"Birthdate: {context.birthdate}")
-            logger.debug(f"User Summary: {context.userSummary if context.userSummary else '(empty)'}")
-            logger.debug(f"Chat History ({len(context.chatHistory)} messages):")
-            for idx, msg in enumerate(context.chatHistory):
-                logger.debug(f"  [{idx}] {msg.role}: {msg.content}")
-            logger.debug(f"=== END FETCHED USER CONTEXT ===")
+            # Lazy: the history dump is only rendered when a DEBUG sink is active
+            logger.opt(lazy=True).debug(
+                "=== FETCHED USER CONTEXT (user_id={}) ===\nChat Interest: {}\nTopics: {}\n"
+                "Birthdate: {}\nUser Summary: {}\nChat History ({} messages):\n{}\n"
+                "=== END FETCHED USER CONTEXT ===",
+                lambda: user_id,
+                lambda: context.chatInterest,
+                lambda: context.topics,
+                lambda: context.birthdate,
+                lambda: context.userSummary or "(empty)",
+                lambda: len(context.chatHistory),
+                lambda: _format_history(context.chatHistory)
+            )
             
             return context
             
         except AppwriteException as e:
-            duration = asyncio.get_event_loop().time() - start_time
+            duration = time.perf_counter() - start_time
             
             # 404 means user doesn't exist - this is expected for new users
             if e.code == 404:
@@ -163,7 +351,7 @@ class DatabaseService:
             )
             raise
         except Exception as e:
-            duration = asyncio.get_event_loop().time() - start_time
+            duration = time.perf_counter() - start_time
             logger.error(
                 f"Unexpected error fetching user context for user_id={user_id} "
                 f"after {duration:.3f}s: {e}",
@@ -176,39 +364,126 @@ class DatabaseService:
         user_id: str,
         chat_history: List[Dict],
         user_summary: str = "",
-        chat_interest: Optional[str] = None
+        chat_interest: Optional[str] = None,
+        birthdate: Optional[str] = None,
+        topics: Optional[List[str]] = None
     ) -> None:
         """
         Update user's chat history, summary, and interest in Appwrite.
         
-        Updates the chatHistory, userSummary, and optionally chatInterest fields for an existing user.
-        Includes retry logic with exponential backoff.
+        With a write_debounce window, updates for a user are coalesced and
+        only the latest state is written once the window elapses; errors are
+        then logged instead of raised. Otherwise the write happens inline.
         
         Args:
             user_id: Unique user identifier
             chat_history: List of message dictionaries with 'role' and 'content'
             user_summary: Optional summary of older messages
             chat_interest: Optional user's interest topic (updated for first-time users)
+            birthdate: User's birthdate, only written if the document has to be created
+            topics: User's topics, only written if the document has to be created
             
         Raises:
-            AppwriteException: If database operation fails after retries
+            AppwriteException: If an immediate write fails after retries
             
         Requirements: 2.5, 3.4, 13.5, 11.1
         """
+        if self.write_debounce <= 0:
+            await self._write_chat_history(
+                user_id, chat_history, user_summary, chat_interest, birthdate, topics
+            )
+            return
+        
+        # Optional fields from an earlier coalesced update must not be lost
+        previous = self._pending_updates.get(user_id)
+        if previous is not None:
+            if chat_interest is None:
+                chat_interest = previous["chat_interest"]
+            if birthdate is None:
+                birthdate = previous["birthdate"]
+            if topics is None:
+                topics = previous["topics"]
+        
+        self._pending_updates[user_id] = {
+            "chat_history": chat_history,
+            "user_summary": user_summary,
+            "chat_interest": chat_interest,
+            "birthdate": birthdate,
+            "topics": topics
+        }
+        
+        if user_id not in self._flush_tasks:
+            self._flush_tasks[user_id] = asyncio.create_task(self._flush_after_debounce(user_id))
+        logger.debug(f"Chat history update queued for user_id={user_id}")
+    
+    async def _flush_after_debounce(self, user_id: str) -> None:
+        """Write a user's pending update once the debounce window has elapsed."""
+        try:
+            await asyncio.sleep(self.write_debounce)
+        finally:
+            if self._flush_tasks.get(user_id) is asyncio.current_task():
+                del self._flush_tasks[user_id]
+        await self._flush_user(user_id)
+    
+    async def _flush_user(self, user_id: str) -> None:
+        """Write a user's pending update, logging failures."""
+        update = self._pending_updates.pop(user_id, None)
+        if update is None:
+            return
+        try:
+            await self._write_chat_history(user_id, **update)
+        except Exception as e:
+            logger.error(f"Debounced chat history write failed for user_id={user_id}: {e}")
+    
+    async def flush(self) -> None:
+        """
+        Write all pending debounced updates immediately.
+        
+        Should be called during application shutdown.
+        """
+        for task in list(self._flush_tasks.values()):
+            task.cancel()
+        self._flush_tasks.clear()
+        
+        if self._pending_updates:
+            logger.info(f"Flushing {len(self._pending_updates)} pending chat history updates")
+            await asyncio.gather(*(self._flush_user(user_id) for user_id in list(self._pending_updates)))
+    
+    async def _write_chat_history(
+        self,
+        user_id: str,
+        chat_history: List[Dict],
+        user_summary: str = "",
+        chat_interest: Optional[str] = None,
+        birthdate: Optional[str] = None,
+        topics: Optional[List[str]] = None
+    ) -> None:
+        """
+        Write user's chat history, summary, and interest to Appwrite.
+        
+        Updates the chatHistory, userSummary, and optionally chatInterest fields for an existing user.
+        Fields equal to what this process last wrote for the user are left out
+        of the update, and nothing is sent if no field changed. If the user's
+        document does not exist (404), the full document (including birthdate
+        and topics) is created instead, as create_user_context would.
+        Includes retry logic with exponential backoff.
+        
+        Raises:
+            AppwriteException: If database operation fails after retries
+        """
         logger.info(
             f"Updating chat history for user_id={user_id}: "
             f"{len(chat_history)} messages, summary_length={len(user_summary) if user_summary else 'No summary yet'}"
         )
-        logger.debug(f"=== UPDATING CHAT HISTORY (user_id={user_id}) ===")
-        logger.debug(f"User Summary: {user_summary if user_summary else '(empty)'}")
-        logger.debug(f"Chat History ({len(chat_history)} messages):")
-        import json
-        for idx, msg in enumerate(chat_history):
-            # msg is now a JSON string, parse it for logging
-            msg_dict = json.loads(msg) if isinstance(msg, str) else msg
-            logger.debug(f"  [{idx}] {msg_dict.get('role', 'unknown')}: {msg_dict.get('content', '')}")
-        logger.debug(f"=== END UPDATING CHAT HISTORY ===")
-        start_time = asyncio.get_event_loop().time()
+        logger.opt(lazy=True).debug(
+            "=== UPDATING CHAT HISTORY (user_id={}) ===\nUser Summary: {}\n"
+            "Chat History ({} messages):\n{}\n=== END UPDATING CHAT HISTORY ===",
+            lambda: user_id,
+            lambda: user_summary or "(empty)",
+            lambda: len(chat_history),
+            lambda: _format_history(chat_history)
+        )
+        start_time = time.perf_counter()
         
         try:
             # Wrap synchronous Appwrite call with retry logic
@@ -216,43 +491,70 @@ class DatabaseService:
             db_id = self.database_id
             coll_id = self.collection_id
             doc_id = user_id
-            update_data = {
+            fields = {
                 "chatHistory": chat_history,
                 "userSummary": user_summary
             }
             
             # Only include chatInterest if it's provided
             if chat_interest is not None:
-                update_data["chatInterest"] = chat_interest
+                fields["chatInterest"] = chat_interest
+            
+            written = self._written.get(user_id, {})
+            update_data = {
+                key: value for key, value in fields.items()
+                if key not in written or written[key] != value
+            }
+            if not update_data:
+                logger.debug(f"Chat history unchanged for user_id={user_id}, skipping update")
+                return
             
             async def _update():
                 logger.debug(
                     f"Calling Appwrite update_document: database_id={db_id}, "
                     f"collection_id={coll_id}, document_id={doc_id}"
                 )
-                loop = asyncio.get_event_loop()
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(
+                    IO_POOL, self.databases.update_document, db_id, coll_id, doc_id, update_data
+                )
+            
+            try:
+                await retry_with_backoff(_update, operation_name="update_chat_history")
+            except AppwriteException as e:
+                if e.code != 404:
+                    raise
+                # The document is missing (e.g. its create failed or never ran),
+                # so write the whole turn as a new document instead of losing it
+                logger.warning(f"Chat history document missing for user_id={user_id}, creating it")
+                document = _user_document(chat_history, chat_interest, user_summary, birthdate, topics)
                 
-                def _sync_call():
-                    return self.databases.update_document(db_id, coll_id, doc_id, update_data)
+                async def _create():
+                    loop = asyncio.get_running_loop()
+                    return await loop.run_in_executor(
+                        IO_POOL, self.databases.create_document, db_id, coll_id, doc_id, document
+                    )
                 
-                return await loop.run_in_executor(None, _sync_call)
+                await retry_with_backoff(_create, operation_name="create_chat_history")
+                update_data = dict(fields)
+            self._remember_written(user_id, update_data)
             
-            await retry_with_backoff(_update, operation_name="update_chat_history")
-            
-            duration = asyncio.get_event_loop().time() - start_time
+            duration = time.perf_counter() - start_time
             logger.info(
                 f"Chat history updated for user_id={user_id} in {duration:.3f}s"
             )
             
         except AppwriteException as e:
-            duration = asyncio.get_event_loop().time() - start_time
+            self._written.pop(user_id, None)
+            duration = time.perf_counter() - start_time
             logger.error(
                 f"Failed to update chat history for user_id={user_id} "
                 f"after {duration:.3f}s: {e.message} (code={e.code})"
             )
             raise
         except Exception as e:
-            duration = asyncio.get_event_loop().time() - start_time
+            duration = time.perf_counter() - start_time
+            self._written.pop(user_id, None)
             logger.error(
                 f"Unexpected error updating chat history for user_id={user_id} "
                 f"after {duration:.3f}s: {e}",
@@ -260,6 +562,15 @@ class DatabaseService:
             )
             raise
 
+    def _remember_written(self, user_id: str, fields: Dict[str, Any]) -> None:
+        """Record fields written for a user, evicting the least recently written user when full."""
+        if self._written_cache_size <= 0:
+            return
+        self._written.setdefault(user_id, {}).update(fields)
+        self._written.move_to_end(user_id)
+        if len(self._written) > self._written_cache_size:
+            self._written.popitem(last=False)
+    
     async def create_user_context(
         self,
         user_id: str,
@@ -287,23 +598,17 @@ class DatabaseService:
             f"topics={len(context.topics)}, "
             f"history={len(context.chatHistory)} messages"
         )
-        start_time = asyncio.get_event_loop().time()
+        start_time = time.perf_counter()
         
         try:
-            # Convert UserContext to JSON string format for Appwrite
-            import json
-            chat_history_data = [
-                json.dumps({"role": msg.role, "content": msg.content})
-                for msg in context.chatHistory
-            ]
-            
-            data = {
-                "chatHistory": chat_history_data,
-                "chatInterest": context.chatInterest,
-                "userSummary": context.userSummary,
-                "birthdate": context.birthdate,
-                "topics": context.topics
-            }
+            # Convert UserContext to Appwrite document format
+            data = _user_document(
+                encode_chat_history(context.chatHistory),
+                context.chatInterest,
+                context.userSummary,
+                context.birthdate,
+                context.topics
+            )
             
             # Wrap synchronous Appwrite call with retry logic
             # Capture variables to avoid closure issues
@@ -316,29 +621,32 @@ class DatabaseService:
                     f"Calling Appwrite create_document: database_id={db_id}, "
                     f"collection_id={coll_id}, document_id={doc_id}"
                 )
-                loop = asyncio.get_event_loop()
-                
-                def _sync_call():
-                    return self.databases.create_document(db_id, coll_id, doc_id, data)
-                
-                return await loop.run_in_executor(None, _sync_call)
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(
+                    IO_POOL, self.databases.create_document, db_id, coll_id, doc_id, data
+                )
             
             await retry_with_backoff(_create, operation_name="create_user_context")
+            self._remember_written(user_id, {
+                "chatHistory": data["chatHistory"],
+                "chatInterest": data["chatInterest"],
+                "userSummary": data["userSummary"]
+            })
             
-            duration = asyncio.get_event_loop().time() - start_time
+            duration = time.perf_counter() - start_time
             logger.info(
                 f"User context created for user_id={user_id} in {duration:.3f}s"
             )
             
         except AppwriteException as e:
-            duration = asyncio.get_event_loop().time() - start_time
+            duration = time.perf_counter() - start_time
             logger.error(
                 f"Failed to create user context for user_id={user_id} "
                 f"after {duration:.3f}s: {e.message} (code={e.code})"
             )
             raise
         except Exception as e:
-            duration = asyncio.get_event_loop().time() - start_time
+            duration = time.perf_counter() - start_time
             logger.error(
                 f"Unexpected error creating user context for user_id={user_id} "
                 f"after {duration:.3f}s: {e}",
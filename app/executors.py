@@ -0,0 +1,8 @@
+"""Shared thread pools for blocking I/O."""
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Dedicated pool for blocking DiskCache and Appwrite SDK calls, so cache and
+# database I/O does not compete with other work on the loop's default executor
+IO_POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix="io")
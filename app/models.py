@@ -1,8 +1,11 @@
 """
 Pydantic models for request/response validation and data structures.
 """
-from pydantic import BaseModel, Field, field_validator, model_validator
-from typing import Optional, List
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
+from typing import Any, Dict, Optional, List
+
+
+_MESSAGE_ROLES = frozenset({"user", "assistant"})
 
 
 class ChatRequest(BaseModel):
@@ -27,6 +30,8 @@ class ChatResponse(BaseModel):
 
 class Message(BaseModel):
     """Individual message in chat history."""
+    model_config = ConfigDict(frozen=True)
+    
     role: str = Field(..., description="Message role: 'user' or 'assistant'")
     content: str = Field(..., description="Message content")
     
@@ -34,7 +39,7 @@ class Message(BaseModel):
     @classmethod
     def validate_role(cls, v):
         """Validate that role is either 'user' or 'assistant'."""
-        if v not in ['user', 'assistant']:
+        if v not in _MESSAGE_ROLES:
             raise ValueError("role must be either 'user' or 'assistant'")
         return v
 
@@ -46,3 +51,76 @@ class UserContext(BaseModel):
     userSummary: str | None = Field(default=None, description="Condensed summary of older messages")
     birthdate: Optional[str] = Field(None, description="User's birthdate in ISO format")
     topics: List[str] = Field(default_factory=list, description="List of user's interest topics")
+    
+    def append_messages(self, *messages: Message, max_length: Optional[int] = None) -> None:
+        """
+        Append messages to chatHistory, keeping at most max_length of them.
+        
+        All producers go through this helper so history cannot grow without
+        bound; when the cap is exceeded the oldest messages are dropped in
+        place, without copying the retained tail.
+        
+        Args:
+            *messages: Messages to append in order
+            max_length: Hard cap on history length (None for no cap)
+        """
+        self.chatHistory.extend(messages)
+        if max_length is not None:
+            self.trim_history(max_length)
+    
+    def trim_history(self, max_length: int) -> None:
+        """
+        Drop the oldest messages in place so at most max_length remain.
+        
+        Args:
+            max_length: Number of most recent messages to keep
+        """
+        overflow = len(self.chatHistory) - max(max_length, 0)
+        if overflow > 0:
+            del self.chatHistory[:overflow]
+    
+    def to_cache(self) -> Dict[str, Any]:
+        """
+        Serialize to a plain cache payload.
+        
+        Messages are stored as (role, content) pairs, which are cheaper to
+        build and store than per-message dicts.
+        """
+        return {
+            "chatHistory": [(msg.role, msg.content) for msg in self.chatHistory],
+            "chatInterest": self.chatInterest,
+            "userSummary": self.userSummary,
+            "birthdate": self.birthdate,
+            "topics": list(self.topics)
+        }
+    
+    @classmethod
+    def from_cache(cls, data: Dict[str, Any]) -> "UserContext":
+        """
+        Rebuild a context from a to_cache() payload without re-validation.
+        
+        The cache only holds data this service wrote, so validation is skipped.
+        Legacy model_dump() payloads with dict messages are also accepted.
+        
+        Raises:
+            ValueError: If the payload does not have the expected shape
+        """
+        history = data.get("chatHistory") or []
+        if not isinstance(history, (list, tuple)):
+            raise ValueError("chatHistory must be a list")
+        
+        messages = []
+        for entry in history:
+            if isinstance(entry, dict):
+                role, content = entry["role"], entry["content"]
+            else:
+                role, content = entry
+            messages.append(Message.model_construct(role=role, content=content))
+        
+        return cls.model_construct(
+            chatHistory=messages,
+            chatInterest=data.get("chatInterest"),
+            userSummary=data.get("userSummary"),
+            birthdate=data.get("birthdate"),
+            topics=list(data.get("topics") or [])
+        )
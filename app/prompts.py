@@ -57,4 +57,41 @@ BASE_PROMPT = dedent(
     *   keep the response consise untill asked for elaborated information.
 
     """
-)
\ No newline at end of file
+)
+
+
+def _split_template(template: str, field: str) -> tuple[str, str]:
+    """Split a template around its single {field} placeholder."""
+    placeholder = "{" + field + "}"
+    if template.count(placeholder) != 1:
+        raise ValueError(f"Expected exactly one {placeholder} in prompt template")
+    prefix, suffix = template.split(placeholder)
+    return prefix, suffix
+
+
+# Templates pre-split once at import, so building a prompt is a single
+# concatenation instead of a str.format pass over the whole template
+_BASE_PRE, _BASE_POST = _split_template(BASE_PROMPT, "parts")
+_CHAT_INTEREST_PRE, _CHAT_INTEREST_POST = _split_template(CHAT_INTEREST_PROMPT, "interest")
+_TOPIC_INTEREST_PRE, _TOPIC_INTEREST_POST = _split_template(TOPIC_INTEREST_PROMPT, "topics")
+_USER_SUMMARY_PRE, _USER_SUMMARY_POST = _split_template(USER_SUMMARY_PROMPT, "summary")
+
+
+def build_base_prompt(parts: str) -> str:
+    """Fill BASE_PROMPT's {parts} placeholder."""
+    return _BASE_PRE + parts + _BASE_POST
+
+
+def build_chat_interest_prompt(interest: str) -> str:
+    """Fill CHAT_INTEREST_PROMPT's {interest} placeholder."""
+    return _CHAT_INTEREST_PRE + interest + _CHAT_INTEREST_POST
+
+
+def build_topic_interest_prompt(topics: str) -> str:
+    """Fill TOPIC_INTEREST_PROMPT's {topics} placeholder."""
+    return _TOPIC_INTEREST_PRE + topics + _TOPIC_INTEREST_POST
+
+
+def build_user_summary_prompt(summary: str) -> str:
+    """Fill USER_SUMMARY_PROMPT's {summary} placeholder."""
+    return _USER_SUMMARY_PRE + summary + _USER_SUMMARY_POST
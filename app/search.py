@@ -1,10 +1,182 @@
 """Search service using DuckDuckGo for web search capabilities."""
 
+import asyncio
 import httpx
-from typing import List, Dict, Optional
+import re
+from cachetools import TTLCache
+from html.parser import HTMLParser
+from functools import partial
+from typing import List, Dict, Optional, Tuple
+from urllib.parse import urlencode
 from loguru import logger
 from app.utils import retry_with_backoff
 
+try:
+    from lxml import etree
+    from lxml import html as lxml_html
+except ImportError:  # pragma: no cover - lxml is optional
+    lxml_html = None
+
+if lxml_html is not None:
+    # Compiled once; evaluated relative to each result container
+    _RESULT_XPATH = etree.XPath(
+        "//div[contains(concat(' ', normalize-space(@class), ' '), ' result ')]"
+    )
+    _TITLE_XPATH = etree.XPath(".//a[contains(@class, 'result__a')]")
+    _SNIPPET_XPATH = etree.XPath(".//a[contains(@class, 'result__snippet')]")
+
+# Opening tag of the first result container, with the class value in double,
+# single or no quotes. Everything before it (head, inline styles and scripts,
+# search form) is skipped without being parsed.
+_FIRST_RESULT_RE = re.compile(r'''<div[^>]*\sclass=['"]?(?:[^'">]*\s)?result[\s'">]''')
+
+
+class _Stop(Exception):
+    """Raised by DuckDuckGoParser to stop parsing once enough results are collected."""
+
+
+def _get_attr(attrs: List[Tuple[str, Optional[str]]], key: str) -> str:
+    """Return one attribute value from HTMLParser's attrs list without building a dict."""
+    for name, value in attrs:
+        if name == key:
+            return value or ""
+    return ""
+
+
+class DuckDuckGoParser(HTMLParser):
+    """Stdlib fallback parser for DuckDuckGo HTML results, used when lxml is not installed."""
+    
+    def __init__(self, target: Optional[int] = None):
+        super().__init__()
+        self.target = target
+        self.results = []
+        self.current_result = {}
+        self.in_result = False
+        self.in_title = False
+        self.in_snippet = False
+        self.capture_data = False
+        
+    def handle_starttag(self, tag, attrs):
+        # Result container
+        if tag == "div":
+            if "result" in _get_attr(attrs, "class").split():
+                self.in_result = True
+                self.current_result = {"title": "", "url": "", "description": ""}
+            return
+        
+        if not self.in_result or tag != "a":
+            return
+        
+        # class and href in one pass over the attributes
+        cls = href = ""
+        for name, value in attrs:
+            if name == "class":
+                cls = value or ""
+            elif name == "href":
+                href = value or ""
+        
+        # Title link
+        if "result__a" in cls:
+            self.in_title = True
+            self.capture_data = True
+            self.current_result["url"] = href
+        
+        # Snippet
+        if "result__snippet" in cls:
+            self.in_snippet = True
+            self.capture_data = True
+    
+    def handle_endtag(self, tag):
+        if tag == "a" and self.in_title:
+            self.in_title = False
+            self.capture_data = False
+        
+        if tag == "a" and self.in_snippet:
+            self.in_snippet = False
+            self.capture_data = False
+        
+        if tag == "div" and self.in_result:
+            if self.current_result["title"] and self.current_result["url"]:
+                self.results.append(self.current_result)
+                if self.target is not None and len(self.results) >= self.target:
+                    raise _Stop
+            self.in_result = False
+            self.current_result = {}
+    
+    def handle_data(self, data):
+        # Most text is outside titles/snippets or whitespace between tags
+        if not self.capture_data or data.isspace():
+            return
+        data = data.strip()
+        if self.in_title:
+            self.current_result["title"] = data
+        elif self.in_snippet:
+            self.current_result["description"] = data
+
+
+_FORM_HEADERS = {"Content-Type": "application/x-www-form-urlencoded"}
+
+
+def _encode_search_form(query: str) -> bytes:
+    """Encode the DuckDuckGo search form once so retries can resend the same bytes."""
+    return urlencode({
+        "q": query,
+        "b": "",  # Start from first result
+        "kl": "wt-wt"  # All regions
+    }).encode()
+
+
+# Process-wide HTTP client so every SearchService shares one keep-alive pool
+_CLIENT: Optional[httpx.AsyncClient] = None
+_DEFAULT_LIMITS = httpx.Limits(
+    max_connections=100,
+    max_keepalive_connections=50,
+    keepalive_expiry=30.0
+)
+
+
+def _get_client(timeout: float, limits: Optional[httpx.Limits] = None) -> httpx.AsyncClient:
+    """
+    Return the shared search HTTP client, creating it on first use.
+    
+    The timeout and limits only take effect when the client is created; later
+    callers share the first caller's settings until the client is closed.
+    """
+    global _CLIENT
+    if _CLIENT is None or _CLIENT.is_closed:
+        # HTTP/2 multiplexes concurrent searches over one kept-alive connection
+        _CLIENT = httpx.AsyncClient(
+            http2=True,
+            limits=limits or _DEFAULT_LIMITS,
+            timeout=timeout,
+            headers={
+                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+            },
+            follow_redirects=True
+        )
+    return _CLIENT
+
+
+def _parse_with_lxml(html_content: str, count: int) -> List[Dict[str, str]]:
+    """Extract up to count results from DuckDuckGo HTML using lxml."""
+    results = []
+    for node in _RESULT_XPATH(lxml_html.fromstring(html_content)):
+        titles = _TITLE_XPATH(node)
+        if not titles:
+            continue
+        title = titles[0].text_content().strip()
+        url = titles[0].get("href", "")
+        if not title or not url:
+            continue
+        
+        snippets = _SNIPPET_XPATH(node)
+        description = snippets[0].text_content().strip() if snippets else ""
+        
+        results.append({"title": title, "url": url, "description": description})
+        if len(results) >= count:
+            break
+    return results
+
 
 class SearchService:
     """
@@ -17,32 +189,50 @@ class SearchService:
     Requirements: 7.1, 7.2, 7.3, 7.4, 13.8, 11.5
     """
     
-    def __init__(self, api_key: str = "", timeout: float = 10.0):
+    def __init__(
+        self,
+        api_key: str = "",
+        timeout: float = 10.0,
+        cache_size: int = 1024,
+        cache_ttl: float = 300.0,
+        limits: Optional[httpx.Limits] = None
+    ):
         """
         Initialize search service.
         
         Args:
             api_key: Not used for DuckDuckGo (kept for compatibility)
             timeout: Request timeout in seconds (default: 10.0)
+            cache_size: Maximum number of (query, count) results kept in
+                memory (0 disables the cache)
+            cache_ttl: Seconds a cached result stays valid (default: 300.0)
+            limits: Connection pool limits for the shared HTTP client
+                (default: 100 connections, 50 kept alive)
         """
         self.api_key = api_key  # Not used but kept for compatibility
         self.base_url = "https://html.duckduckgo.com/html/"
         self.timeout = timeout
-        self.client = httpx.AsyncClient(
-            timeout=timeout,
-            headers={
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-            },
-            follow_redirects=True
+        self.limits = limits
+        self._results_cache: Optional[TTLCache] = (
+            TTLCache(maxsize=cache_size, ttl=cache_ttl) if cache_size > 0 else None
         )
+        self._inflight: Dict[Tuple[str, int], asyncio.Task] = {}
+        _get_client(timeout, limits)
         logger.info(f"SearchService initialized with DuckDuckGo: timeout={timeout}s")
     
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """HTTP client shared by all SearchService instances in the process."""
+        return _get_client(self.timeout, self.limits)
+    
     async def search(self, query: str, count: int = 5) -> List[Dict[str, str]]:
         """
         Perform web search via DuckDuckGo.
         
         Executes a web search query and returns formatted results suitable
         for LLM consumption. Includes retry logic for transient failures.
+        Non-empty results are cached per normalized (query, count) for the
+        configured TTL, and concurrent identical searches share one request.
         
         Args:
             query: Search query string
@@ -59,6 +249,43 @@ class SearchService:
             
         Requirements: 7.1, 7.2, 7.3, 13.8
         """
+        cache_key = (query.strip().lower(), count)
+        if self._results_cache is not None:
+            cached = self._results_cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"Search cache hit: query='{query}', results_count={len(cached)}")
+                # Copy so callers cannot mutate the cached entries
+                return [dict(result) for result in cached]
+        
+        # Single-flight: identical concurrent searches share one upstream request.
+        # It runs as its own task and every caller awaits it through a shield, so
+        # a cancelled caller (e.g. an abandoned speculative search) never cuts
+        # short the results of the others
+        task = self._inflight.get(cache_key)
+        if task is None:
+            task = asyncio.create_task(self._search_uncached(query, count, cache_key))
+            self._inflight[cache_key] = task
+            task.add_done_callback(partial(self._inflight_done, cache_key))
+        else:
+            logger.info(f"Joining in-flight search: query='{query}', count={count}")
+        
+        results = await asyncio.shield(task)
+        return [dict(result) for result in results]
+    
+    def _inflight_done(self, cache_key: Tuple[str, int], task: asyncio.Task) -> None:
+        """Forget a finished shared search, retrieving its outcome in case every caller left."""
+        if self._inflight.get(cache_key) is task:
+            del self._inflight[cache_key]
+        if not task.cancelled():
+            task.exception()
+    
+    async def _search_uncached(
+        self,
+        query: str,
+        count: int,
+        cache_key: Tuple[str, int]
+    ) -> List[Dict[str, str]]:
+        """Run a search against DuckDuckGo and cache non-empty results."""
         logger.info(f"Performing DuckDuckGo search: query='{query}', count={count}")
         
         try:
@@ -68,11 +295,17 @@ class SearchService:
                 max_retries=3,
                 base_delay=1.0,
                 max_delay=10.0,
+                retry_on=(httpx.TransportError, httpx.HTTPStatusError),
                 query=query,
-                count=count
+                count=count,
+                body=_encode_search_form(query)
             )
             
             logger.info(f"Search completed: query='{query}', results_count={len(results)}")
+            
+            # Empty results are not cached so a transient blank page is retried next time
+            if results and self._results_cache is not None:
+                self._results_cache[cache_key] = [dict(result) for result in results]
             return results
             
         except Exception as e:
@@ -81,13 +314,19 @@ class SearchService:
             # This allows the LLM to continue without search results
             return []
     
-    async def _perform_search(self, query: str, count: int) -> List[Dict[str, str]]:
+    async def _perform_search(
+        self,
+        query: str,
+        count: int,
+        body: Optional[bytes] = None
+    ) -> List[Dict[str, str]]:
         """
         Internal method to perform the actual API request.
         
         Args:
             query: Search query string
             count: Number of results to return
+            body: Pre-encoded form body for query, reused across retries
             
         Returns:
             List of formatted search results
@@ -96,15 +335,13 @@ class SearchService:
             httpx.HTTPError: If the API request fails
         """
         # DuckDuckGo HTML search uses POST with form data
-        data = {
-            "q": query,
-            "b": "",  # Start from first result
-            "kl": "wt-wt"  # All regions
-        }
+        if body is None:
+            body = _encode_search_form(query)
         
         response = await self.client.post(
             self.base_url,
-            data=data
+            content=body,
+            headers=_FORM_HEADERS
         )
         
         response.raise_for_status()
@@ -128,91 +365,44 @@ class SearchService:
             
         Requirements: 7.3
         """
-        from html.parser import HTMLParser
-        
-        class DuckDuckGoParser(HTMLParser):
-            def __init__(self):
-                super().__init__()
-                self.results = []
-                self.current_result = {}
-                self.in_result = False
-                self.in_title = False
-                self.in_snippet = False
-                self.capture_data = False
-                
-            def handle_starttag(self, tag, attrs):
-                attrs_dict = dict(attrs)
-                
-                # Result container
-                if tag == "div" and attrs_dict.get("class") == "result":
-                    self.in_result = True
-                    self.current_result = {}
-                
-                # Title link
-                if self.in_result and tag == "a" and "result__a" in attrs_dict.get("class", ""):
-                    self.in_title = True
-                    self.capture_data = True
-                    self.current_result["url"] = attrs_dict.get("href", "")
-                
-                # Snippet
-                if self.in_result and tag == "a" and "result__snippet" in attrs_dict.get("class", ""):
-                    self.in_snippet = True
-                    self.capture_data = True
-            
-            def handle_endtag(self, tag):
-                if tag == "a" and self.in_title:
-                    self.in_title = False
-                    self.capture_data = False
-                
-                if tag == "a" and self.in_snippet:
-                    self.in_snippet = False
-                    self.capture_data = False
-                
-                if tag == "div" and self.in_result:
-                    if self.current_result.get("title") and self.current_result.get("url"):
-                        self.results.append(self.current_result)
-                    self.in_result = False
-                    self.current_result = {}
-            
-            def handle_data(self, data):
-                if self.capture_data:
-                    data = data.strip()
-                    if data:
-                        if self.in_title:
-                            self.current_result["title"] = data
-                        elif self.in_snippet:
-                            self.current_result["description"] = data
-        
-        parser = DuckDuckGoParser()
+        if not html_content:
+            return []
+        
+        # Markup the pre-scan does not recognise is parsed in full, not dropped
+        first_result = _FIRST_RESULT_RE.search(html_content)
+        if first_result is not None:
+            html_content = html_content[first_result.start():]
+        
         try:
-            parser.feed(html_content)
+            if lxml_html is not None:
+                results = _parse_with_lxml(html_content, count)
+            else:
+                parser = DuckDuckGoParser(target=count)
+                try:
+                    parser.feed(html_content)
+                except _Stop:
+                    pass
+                results = parser.results[:count]
         except Exception as e:
             logger.error(f"Failed to parse DuckDuckGo HTML: {e}")
             return []
         
-        # Limit results to requested count
-        results = parser.results[:count]
-        
-        # Ensure all results have required fields
-        formatted_results = []
-        for result in results:
-            formatted_results.append({
-                "title": result.get("title", ""),
-                "url": result.get("url", ""),
-                "description": result.get("description", "")
-            })
-        
-        return formatted_results
+        # Both parsers create every result with title, url and description
+        return results
     
     async def close(self) -> None:
         """
         Close HTTP client and cleanup resources.
         
         Should be called during application shutdown to properly close
-        the httpx client and release resources.
+        the httpx client and release resources. The client is shared, so this
+        closes it for every instance; the next search opens a new one.
         
         Requirements: 11.5
         """
-        await self.client.aclose()
+        global _CLIENT
+        client, _CLIENT = _CLIENT, None
+        if client is not None:
+            await client.aclose()
         logger.info("SearchService closed")
 
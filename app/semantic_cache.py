@@ -0,0 +1,104 @@
+"""Semantic response cache for near-duplicate user messages."""
+
+import math
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Hashable, List, Optional, Sequence, Tuple
+from loguru import logger
+
+
+# (monotonic expiry, unit-length embedding, response)
+_Entry = Tuple[float, Tuple[float, ...], str]
+
+
+class SemanticResponseCache:
+    """
+    In-process cache of LLM responses looked up by embedding similarity.
+    
+    Entries are grouped by a caller-chosen scope (e.g. user ID, provider and a
+    digest of the system prompt), so a response is only reused for a similar
+    message from the same user with the same context.
+    Each scope keeps its most recent entries; scopes are evicted LRU.
+    """
+    
+    def __init__(
+        self,
+        embed: Callable[[str], Awaitable[Sequence[float]]],
+        threshold: float = 0.9,
+        ttl: float = 3600.0,
+        max_scopes: int = 1024,
+        max_entries_per_scope: int = 32
+    ):
+        """
+        Initialize semantic response cache.
+        
+        Args:
+            embed: Async function returning an embedding vector for a text
+            threshold: Minimum cosine similarity for a cache hit
+            ttl: Seconds a cached response stays valid
+            max_scopes: Maximum number of scopes kept
+            max_entries_per_scope: Maximum number of responses kept per scope
+        """
+        self._embed = embed
+        self.threshold = threshold
+        self.ttl = ttl
+        self._max_scopes = max_scopes
+        self._max_entries_per_scope = max_entries_per_scope
+        self._scopes: "OrderedDict[Hashable, List[_Entry]]" = OrderedDict()
+    
+    async def embed(self, text: str) -> Optional[Tuple[float, ...]]:
+        """
+        Embed a text and normalize it to unit length.
+        
+        Returns:
+            Unit-length embedding, or None if the embedding is empty or zero
+        """
+        vector = await self._embed(text)
+        norm = math.sqrt(sum(x * x for x in vector))
+        if not norm:
+            return None
+        return tuple(x / norm for x in vector)
+    
+    def lookup(self, scope: Hashable, embedding: Tuple[float, ...]) -> Optional[str]:
+        """
+        Return the most similar live response in scope, if similar enough.
+        
+        Args:
+            scope: Context the response must have been generated in
+            embedding: Unit-length embedding from embed()
+        
+        Returns:
+            Cached response with similarity >= threshold, None otherwise
+        """
+        entries = self._scopes.get(scope)
+        if not entries:
+            return None
+        
+        now = time.monotonic()
+        entries[:] = [entry for entry in entries if entry[0] > now]
+        
+        best_score, best_response = self.threshold, None
+        for _, vector, response in entries:
+            # Both vectors are unit length, so the dot product is the cosine similarity
+            score = sum(a * b for a, b in zip(embedding, vector))
+            if score >= best_score:
+                best_score, best_response = score, response
+        
+        if best_response is not None:
+            self._scopes.move_to_end(scope)
+            logger.debug(f"Semantic cache hit: similarity={best_score:.3f}")
+        return best_response
+    
+    def store(self, scope: Hashable, embedding: Tuple[float, ...], response: str) -> None:
+        """Cache a response for an embedded message in scope."""
+        if not response:
+            return
+        
+        entries = self._scopes.setdefault(scope, [])
+        entries.append((time.monotonic() + self.ttl, embedding, response))
+        if len(entries) > self._max_entries_per_scope:
+            del entries[0]
+        
+        self._scopes.move_to_end(scope)
+        if len(self._scopes) > self._max_scopes:
+            self._scopes.popitem(last=False)
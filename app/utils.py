@@ -3,13 +3,23 @@
 from loguru import logger
 import sys
 import asyncio
+import time
 from functools import wraps
-from typing import Callable, Any, TypeVar
+from typing import Callable, Any, Dict, List, Tuple, Type, TypeVar
+import httpx
 import random
 
 
 T = TypeVar('T')
 
+# HTTP statuses worth retrying; any other HTTPStatusError is raised immediately
+RETRYABLE_STATUS_CODES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+# Paragraphs shorter than this are never deduplicated ("Yes", "Thanks!", ...)
+DEDUPE_MIN_BLOCK_CHARS = 200
+# Opening characters of a repeated paragraph quoted in its replacement note
+DEDUPE_QUOTE_CHARS = 60
+
 
 def configure_logging(log_level: str, rotation: str, retention: str) -> None:
     """
@@ -47,7 +57,7 @@ def configure_logging(log_level: str, rotation: str, retention: str) -> None:
         format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}",
         enqueue=True,  # Thread-safe logging
         backtrace=True,  # Include full stack trace on errors
-        diagnose=True  # Include variable values in stack traces
+        diagnose=False  # No variable values: frame locals hold API keys and chat content
     )
     
     logger.info(f"Logging configured: level={log_level}, rotation={rotation}, retention={retention}")
@@ -70,16 +80,19 @@ def log_execution_time(func: Callable[..., T]) -> Callable[..., T]:
     """
     @wraps(func)
     async def wrapper(*args, **kwargs) -> T:
-        start = asyncio.get_event_loop().time()
+        start = time.perf_counter()
         func_name = func.__name__
         
         try:
             result = await func(*args, **kwargs)
-            duration = asyncio.get_event_loop().time() - start
-            logger.info(f"{func_name} completed in {duration:.3f}s")
+            duration = time.perf_counter() - start
+            # Formatted only if INFO is enabled
+            logger.opt(lazy=True).info(
+                "{} completed in {}s", lambda: func_name, lambda: f"{duration:.3f}"
+            )
             return result
         except Exception as e:
-            duration = asyncio.get_event_loop().time() - start
+            duration = time.perf_counter() - start
             logger.error(f"{func_name} failed after {duration:.3f}s: {e}")
             raise
     
@@ -94,6 +107,7 @@ async def retry_with_backoff(
     jitter: float = 0.1,
     operation_name: str = None,
     *args,
+    retry_on: Tuple[Type[BaseException], ...] = (Exception,),
     **kwargs
 ) -> T:
     """
@@ -107,9 +121,12 @@ async def retry_with_backoff(
         max_retries: Maximum number of retry attempts (default: 3)
         base_delay: Initial delay in seconds (default: 1.0)
         max_delay: Maximum delay in seconds (default: 10.0)
-        jitter: Random jitter factor (default: 0.1 = 10%)
+        jitter: Random jitter factor, below 1 (default: 0.1 = 10%)
         operation_name: Optional descriptive name for the operation (for better logging)
         *args: Positional arguments to pass to func
+        retry_on: Exception types that are retried; others are raised immediately
+            (default: every Exception). An httpx.HTTPStatusError is only retried
+            for statuses in RETRYABLE_STATUS_CODES.
         **kwargs: Keyword arguments to pass to func
         
     Returns:
@@ -120,8 +137,6 @@ async def retry_with_backoff(
         
     Requirements: 13.11
     """
-    import traceback
-    
     func_name = operation_name or func.__name__
     last_exception = None
     
@@ -132,41 +147,99 @@ async def retry_with_backoff(
                 logger.info(f"[{func_name}] succeeded on attempt {attempt + 1}")
             return result
         except Exception as e:
+            if not _is_retryable(e, retry_on):
+                logger.warning(f"[{func_name}] {type(e).__name__} is not retryable: {e}")
+                raise
             last_exception = e
             
-            # Extract comprehensive error details
-            error_msg = str(e)
             error_type = type(e).__name__
             
-            # Get full traceback for detailed debugging
-            tb_lines = traceback.format_exception(type(e), e, e.__traceback__)
-            full_traceback = ''.join(tb_lines)
-            
-            # Log detailed error information
+            # Retries log only the error; the traceback is attached once, on
+            # the final failure, and loguru renders it only if it is emitted
             if attempt < max_retries - 1:
                 # Calculate delay with exponential backoff
                 delay = min(base_delay * (2 ** attempt), max_delay)
                 
-                # Add random jitter
-                jitter_amount = delay * jitter * random.uniform(-1, 1)
-                delay_with_jitter = max(0, delay + jitter_amount)
+                # Add symmetric random jitter; stays positive while jitter < 1
+                delay_with_jitter = delay * (1.0 + jitter * (2.0 * random.random() - 1.0))
                 
                 logger.warning(
-                    f"[{func_name}] {error_type} on attempt {attempt + 1}/{max_retries}\n"
-                    f"Error message: {error_msg}\n"
-                    f"Error type: {error_type}\n"
-                    f"Retrying in {delay_with_jitter:.2f}s...\n"
-                    f"Traceback:\n{full_traceback}"
+                    "[{}] {} on attempt {}/{}: {!r}\nRetrying in {:.2f}s...",
+                    func_name, error_type, attempt + 1, max_retries, e, delay_with_jitter
                 )
                 
                 await asyncio.sleep(delay_with_jitter)
             else:
-                logger.error(
-                    f"[{func_name}] {error_type} after {max_retries} attempts - GIVING UP\n"
-                    f"Error message: {error_msg}\n"
-                    f"Error type: {error_type}\n"
-                    f"Full traceback:\n{full_traceback}"
+                logger.opt(exception=e).error(
+                    "[{}] {} after {} attempts - GIVING UP: {}",
+                    func_name, error_type, max_retries, e
                 )
     
     # All retries exhausted
     raise last_exception
+
+
+def _is_retryable(error: Exception, retry_on: Tuple[Type[BaseException], ...]) -> bool:
+    """Return True if error is one of retry_on and not a non-transient HTTP status."""
+    if not isinstance(error, retry_on):
+        return False
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRYABLE_STATUS_CODES
+    return True
+
+
+def _repeat_note(block: str, role: str) -> str:
+    """Describe a repeated paragraph by the role of its first message and its opening words."""
+    opening = block.strip().split("\n", 1)[0]
+    if len(opening) > DEDUPE_QUOTE_CHARS:
+        opening = opening[:DEDUPE_QUOTE_CHARS].rstrip() + "..."
+    source = "assistant reply" if role == "assistant" else f"{role} message"
+    return f'[repeated text omitted: same as the passage starting "{opening}" in an earlier {source}]'
+
+
+def dedupe_context(
+    messages: List[Dict[str, Any]],
+    min_block_chars: int = DEDUPE_MIN_BLOCK_CHARS
+) -> List[Dict[str, Any]]:
+    """
+    Replace repeated paragraphs in earlier messages with short references.
+    
+    Message content is split into paragraphs on blank lines. A paragraph of
+    at least min_block_chars that already appeared in an earlier message
+    (e.g. re-pasted text or repeated boilerplate) is replaced by a note naming
+    the earlier message's role and quoting the block's opening words, so the
+    model can find the first occurrence while prompt tokens are cut. The last message is the
+    current turn and is never rewritten. Messages are not mutated; changed
+    ones are copied.
+    
+    Args:
+        messages: Message dicts with 'role' and 'content' in conversation order
+        min_block_chars: Minimum paragraph length eligible for deduplication
+        
+    Returns:
+        List of message dicts with repeated paragraphs replaced
+    """
+    # Paragraph -> (index, role) of the message it first appeared in
+    first_seen: Dict[str, Tuple[int, str]] = {}
+    result = []
+    last_index = len(messages) - 1
+    
+    for index, message in enumerate(messages):
+        content = message.get("content")
+        if not content or len(content) < min_block_chars:
+            result.append(message)
+            continue
+        
+        blocks = content.split("\n\n")
+        changed = False
+        for block_index, block in enumerate(blocks):
+            if len(block) < min_block_chars:
+                continue
+            first, role = first_seen.setdefault(block, (index, message.get("role", "user")))
+            if first != index and index != last_index:
+                blocks[block_index] = _repeat_note(block, role)
+                changed = True
+        
+        result.append({**message, "content": "\n\n".join(blocks)} if changed else message)
+    
+    return result
@@ -6,9 +6,19 @@ This script checks if the environment is properly configured for running E2E tes
 
 import os
 import sys
+from importlib.util import find_spec
 from pathlib import Path
 
 
+def _scan_dir(path):
+    """Return a directory's entries keyed by name, or an empty dict if it does not exist."""
+    try:
+        with os.scandir(path) as it:
+            return {entry.name: entry for entry in it}
+    except FileNotFoundError:
+        return {}
+
+
 def check_env_file():
     """Check if .env file exists and has required variables."""
     print("Checking .env file...")
@@ -35,14 +45,18 @@ def check_env_file():
         'BRAVE_API_KEY'
     ]
     
-    missing_vars = []
-    
-    with open('.env', 'r') as f:
-        content = f.read()
-        
-        for var in required_vars:
-            if f"{var}=" not in content or f"{var}=your_" in content:
-                missing_vars.append(var)
+    # Parse once into a dict; commented-out lines do not count as set
+    env = {}
+    for line in Path('.env').read_text().splitlines():
+        line = line.strip()
+        if line and not line.startswith('#') and '=' in line:
+            key, value = line.split('=', 1)
+            env[key.strip()] = value.strip()
+    
+    missing_vars = [
+        var for var in required_vars
+        if not env.get(var) or env[var].startswith('your_')
+    ]
     
     if missing_vars:
         print(f"⚠ Warning: The following variables may not be configured:")
@@ -76,10 +90,16 @@ def check_dependencies():
     missing = []
     
     for package, name in required_packages:
+        # find_spec locates the package without importing (and initializing) it
         try:
-            __import__(package)
-            print(f"✓ {name}")
+            found = find_spec(package) is not None
         except ImportError:
+            # Parent package of a dotted name is missing
+            found = False
+        
+        if found:
+            print(f"✓ {name}")
+        else:
             print(f"❌ {name}")
             missing.append(name)
     
@@ -98,9 +118,11 @@ def check_directories():
     print("\nChecking directories...")
     
     dirs = ['cache', 'logs', 'app', 'tests']
+    entries = _scan_dir('.')
     
     for dir_name in dirs:
-        if os.path.exists(dir_name):
+        entry = entries.get(dir_name)
+        if entry is not None and entry.is_dir():
             print(f"✓ {dir_name}/")
         else:
             print(f"⚠ {dir_name}/ not found")
@@ -125,8 +147,15 @@ def check_main_files():
     
     all_exist = True
     
+    # One directory listing per parent instead of one stat per file
+    listings = {}
+    for file in files:
+        parent = os.path.dirname(file) or '.'
+        if parent not in listings:
+            listings[parent] = _scan_dir(parent)
+    
     for file in files:
-        if os.path.exists(file):
+        if os.path.basename(file) in listings[os.path.dirname(file) or '.']:
             print(f"✓ {file}")
         else:
             print(f"❌ {file}")
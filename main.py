@@ -7,25 +7,33 @@ intelligent caching, and web search capabilities.
 Requirements: 1.1, 1.2, 1.3, 1.4, 10.3, 10.4, 10.5
 """
 
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from loguru import logger
+from appwrite.exception import AppwriteException
+from pydantic import ValidationError
 from contextlib import asynccontextmanager
 import asyncio
+import httpx
+import random
+import traceback
+from typing import List
 
-from app.config import get_settings
+from app.config import Settings, get_settings
 from app.models import ChatRequest, ChatResponse, Message, UserContext
 from app.cache import CacheManager
-from app.db_service import DatabaseService
+from app.db_service import DatabaseService, encode_chat_history
 from app.ai_agent import AIAgent
 from app.search import SearchService
-from app.utils import configure_logging
+from app.utils import configure_logging, dedupe_context
 
 
-# Global service instances
+# Global settings and service instances, set once in lifespan
+settings: Settings = None
 cache_manager: CacheManager = None
 db_service: DatabaseService = None
 ai_agent: AIAgent = None
@@ -33,16 +41,28 @@ search_service: SearchService = None
 cleanup_task: asyncio.Task = None
 
 
+CACHE_CLEANUP_INTERVAL = 3600  # seconds
+CACHE_CLEANUP_JITTER = 300  # seconds, applied in both directions
+
+# Chat histories with more content than this are encoded off the event loop;
+# below it the thread hand-off costs more than the encode itself
+ENCODE_OFFLOAD_CHARS = 256 * 1024
+
+
 async def periodic_cache_cleanup():
     """
     Background task to periodically clean up expired cache entries.
     
-    Runs every hour to remove expired entries from DiskCache.
+    Runs about every hour to remove expired entries from DiskCache.
     DiskCache uses lazy deletion, so this ensures disk space is reclaimed.
+    The interval is jittered so workers started together do not all sweep
+    the shared cache directory in the same second.
     """
     while True:
         try:
-            await asyncio.sleep(3600)  # Run every hour
+            await asyncio.sleep(
+                CACHE_CLEANUP_INTERVAL + random.uniform(-CACHE_CLEANUP_JITTER, CACHE_CLEANUP_JITTER)
+            )
             if cache_manager:
                 count = await cache_manager.cleanup_expired()
                 logger.info(f"Periodic cache cleanup completed: {count} entries removed")
@@ -53,6 +73,55 @@ async def periodic_cache_cleanup():
             logger.error(f"Error in periodic cache cleanup: {e}", exc_info=True)
 
 
+async def persist_chat_turn(
+    user_id: str,
+    user_context: UserContext,
+    chat_history: list,
+    user_existed_in_db: bool
+) -> None:
+    """
+    Write a completed chat turn to the database.
+    
+    Runs as a response background task, so the client gets its reply without
+    waiting for Appwrite. Failures are logged; the context is still cached.
+    
+    Args:
+        user_id: Unique user identifier
+        user_context: Context after this turn (and any summarization)
+        chat_history: Chat history encoded for the database
+        user_existed_in_db: False to create the user document instead of updating it
+    """
+    try:
+        if not user_existed_in_db:
+            # Create new user in database
+            try:
+                await db_service.create_user_context(user_id, user_context)
+            except AppwriteException as e:
+                if e.code != 409:
+                    raise
+                # Another request created the document first; update it instead
+                await db_service.update_chat_history(
+                    user_id=user_id,
+                    chat_history=chat_history,
+                    user_summary=user_context.userSummary,
+                    chat_interest=user_context.chatInterest,
+                    birthdate=user_context.birthdate,
+                    topics=user_context.topics
+                )
+        else:
+            # Update existing user
+            await db_service.update_chat_history(
+                user_id=user_id,
+                chat_history=chat_history,
+                user_summary=user_context.userSummary,
+                chat_interest=user_context.chatInterest,
+                birthdate=user_context.birthdate,
+                topics=user_context.topics
+            )
+    except Exception as e:
+        logger.error(f"Failed to persist chat turn for user_id={user_id}: {type(e).__name__}: {e}")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
@@ -63,7 +132,7 @@ async def lifespan(app: FastAPI):
     Requirements: 1.4
     """
     # Startup
-    global cache_manager, db_service, ai_agent, search_service, cleanup_task
+    global settings, cache_manager, db_service, ai_agent, search_service, cleanup_task
     
     settings = get_settings()
     
@@ -87,21 +156,33 @@ async def lifespan(app: FastAPI):
         project_id=settings.appwrite_project_id,
         api_key=settings.appwrite_api_key,
         database_id=settings.appwrite_database_id,
-        collection_id=settings.appwrite_collection_id
+        collection_id=settings.appwrite_collection_id,
+        write_debounce=settings.appwrite_write_debounce_seconds
+    )
+    
+    http_limits = httpx.Limits(
+        max_connections=settings.http_max_connections,
+        max_keepalive_connections=settings.http_max_keepalive_connections
     )
     
     search_service = SearchService(
         api_key=settings.brave_api_key,
-        timeout=10.0
+        timeout=10.0,
+        limits=http_limits
     )
     
     ai_agent = AIAgent(
         openai_key=settings.openai_api_key,
         gemini_key=settings.gemini_api_key,
         default_provider=settings.default_llm_provider,
-        search_service=search_service
+        search_service=search_service,
+        semantic_cache_threshold=settings.semantic_cache_threshold,
+        http_limits=http_limits
     )
     
+    # Pay the first-request cost of opening DiskCache and the Appwrite connection now
+    await asyncio.gather(cache_manager.warmup(), db_service.warmup())
+    
     # Start background cache cleanup task
     cleanup_task = asyncio.create_task(periodic_cache_cleanup())
     logger.info("Background cache cleanup task started")
@@ -122,12 +203,18 @@ async def lifespan(app: FastAPI):
             pass
     
     # Cleanup resources
+    if db_service:
+        await db_service.flush()
+    
     if cache_manager:
         await cache_manager.close()
     
     if search_service:
         await search_service.close()
     
+    if ai_agent:
+        await ai_agent.close()
+    
     logger.info("Application shutdown complete")
 
 
@@ -136,20 +223,46 @@ app = FastAPI(
     title="Chat Agent API",
     version="1.0.0",
     description="Personalized AI chat agent with multi-provider LLM support",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse  # orjson is already used for cache and history encoding
 )
 
 # Configure CORS middleware
+def _cors_origins() -> List[str]:
+    """Return the allowed CORS origins from settings."""
+    try:
+        return get_settings().cors_origins
+    except ValidationError:
+        # Incomplete environment (e.g. tests); lifespan validates settings at startup
+        return ["*"]
+
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # Configure appropriately for production
+    allow_origins=_cors_origins(),
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["POST", "GET"],
+    allow_headers=["Authorization", "Content-Type"],
+    max_age=86400,  # Let browsers cache preflight responses for 24 hours
 )
 
 # Configure rate limiting
-limiter = Limiter(key_func=get_remote_address)
+def _rate_limit_storage_uri() -> str:
+    """
+    Return the rate limit storage: Redis when REDIS_URL is set, otherwise memory.
+    
+    In-memory counters are per process, so with several workers each one
+    enforces its own limit; Redis makes the limit global.
+    """
+    try:
+        redis_url = get_settings().redis_url
+    except ValidationError:
+        # Incomplete environment (e.g. tests); lifespan validates settings at startup
+        redis_url = None
+    return redis_url or "memory://"
+
+
+limiter = Limiter(key_func=get_remote_address, storage_uri=_rate_limit_storage_uri())
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
@@ -175,7 +288,11 @@ async def health_check():
 
 @app.post("/chat", response_model=ChatResponse)
 @limiter.limit("10/minute")
-async def chat_endpoint(request: Request, chat_request: ChatRequest) -> ChatResponse:
+async def chat_endpoint(
+    request: Request,
+    chat_request: ChatRequest,
+    background_tasks: BackgroundTasks
+) -> ChatResponse:
     """
     Main chat endpoint for processing user messages.
     
@@ -185,6 +302,7 @@ async def chat_endpoint(request: Request, chat_request: ChatRequest) -> ChatResp
     Args:
         request: FastAPI request object (for rate limiting)
         chat_request: Validated chat request payload
+        background_tasks: Tasks run after the response is sent (database write)
         
     Returns:
         ChatResponse: AI-generated response in Markdown format
@@ -204,11 +322,17 @@ async def chat_endpoint(request: Request, chat_request: ChatRequest) -> ChatResp
     )
     
     try:
-        settings = get_settings()
+        max_context = settings.previous_message_context_length
+        threshold = max_context + settings.overlap_count
         
         # Step 1: Check cache for user context
         user_context = await cache_manager.get(user_id)
         
+        # Cached contexts were read from the database or queued for creation by
+        # an earlier turn. That create may have failed or not finished yet, so
+        # updates fall back to creating the document when it is missing (404)
+        user_existed_in_db = True
+        
         # Step 2: Handle cache miss - fetch from database
         if user_context is None:
             logger.info(f"Cache miss for user_id={user_id}, fetching from database")
@@ -217,16 +341,15 @@ async def chat_endpoint(request: Request, chat_request: ChatRequest) -> ChatResp
             # If user doesn't exist in database either, create new context
             if user_context is None:
                 logger.info(f"New user detected: user_id={user_id}")
-                user_context = UserContext(
+                user_existed_in_db = False
+                user_context = UserContext.model_construct(
                     chatHistory=[],
                     chatInterest=interest_topic if is_first_time else None,
                     userSummary="",
                     birthdate=None,
                     topics=[]
                 )
-            else:
-                # Cache the fetched context
-                await cache_manager.set(user_id, user_context)
+            # A fetched context is not cached here; Step 8 caches it with this turn
         
         # Step 3: Handle first-time user flow
         if is_first_time:
@@ -260,7 +383,6 @@ async def chat_endpoint(request: Request, chat_request: ChatRequest) -> ChatResp
             )
             
             # Prepare messages with recent history
-            max_context = settings.previous_message_context_length
             recent_messages = user_context.chatHistory[-max_context:] if user_context.chatHistory else []
             
             # Convert Message objects to dicts
@@ -271,6 +393,9 @@ async def chat_endpoint(request: Request, chat_request: ChatRequest) -> ChatResp
             
             # Add current user message
             messages.append({"role": "user", "content": actual_message})
+            
+            # Collapse paragraphs repeated across the history to save prompt tokens
+            messages = dedupe_context(messages)
         
         # Step 5: Generate AI response
         logger.info(
@@ -281,47 +406,59 @@ async def chat_endpoint(request: Request, chat_request: ChatRequest) -> ChatResp
             f"Is first time: {is_first_time}"
             f"User message is : {actual_message}"
         )
-        logger.debug(f"=== SYSTEM PROMPT ===\n{system_prompt}\n=== END SYSTEM PROMPT ===")
-        logger.debug(f"=== MESSAGES TO SEND ===")
-        for idx, msg in enumerate(messages):
-            logger.debug(f"Message {idx} [{msg['role']}]: {msg.get('content', '')}")
-        logger.debug(f"=== END MESSAGES ===")
+        # Lazy: the dumps are only formatted when a DEBUG sink is active
+        logger.opt(lazy=True).debug(
+            "=== SYSTEM PROMPT ===\n{}\n=== END SYSTEM PROMPT ===\n"
+            "=== MESSAGES TO SEND ===\n{}\n=== END MESSAGES ===",
+            lambda: system_prompt,
+            lambda: "\n".join(
+                f"Message {idx} [{msg['role']}]: {msg.get('content', '')}"
+                for idx, msg in enumerate(messages)
+            )
+        )
         
         response_text, updated_messages = await ai_agent.generate_response(
             messages=messages,
             system_prompt=system_prompt,
             user_context=user_context,
-            provider=settings.default_llm_provider
+            provider=settings.default_llm_provider,
+            user_id=user_id
         )
         
-        logger.debug(f"=== AI RESPONSE ===\n{response_text}\n=== END AI RESPONSE ===")
-        logger.debug(f"Updated messages count: {len(updated_messages)}")
-        
-        # Step 6: Update chat history
-        # Add user message to history
-        user_context.chatHistory.append(
-            Message(role="user", content=actual_message)
+        logger.opt(lazy=True).debug(
+            "=== AI RESPONSE ===\n{}\n=== END AI RESPONSE ===\nUpdated messages count: {}",
+            lambda: response_text,
+            lambda: len(updated_messages)
         )
         
-        # Add assistant response to history
-        user_context.chatHistory.append(
-            Message(role="assistant", content=response_text)
+        # Step 6: Update chat history
+        # Roles are fixed and the user message was validated by ChatRequest,
+        # so the messages are built without another validation pass
+        # History is capped one turn past the summarization threshold, so both
+        # new messages always reach the summarizer before anything is dropped
+        user_context.append_messages(
+            Message.model_construct(role="user", content=actual_message),
+            Message.model_construct(role="assistant", content=response_text),
+            max_length=threshold + 2
         )
         
         logger.info(
             f"Chat history updated: user_id={user_id}, "
             f"total_messages={len(user_context.chatHistory)}"
         )
-        logger.debug(f"=== FULL CHAT HISTORY (user_id={user_id}) ===")
-        for idx, msg in enumerate(user_context.chatHistory):
-            logger.debug(f"[{idx}] {msg.role}: {msg.content}")
-        logger.debug(f"=== END CHAT HISTORY ===")
+        logger.opt(lazy=True).debug(
+            "=== FULL CHAT HISTORY (user_id={}) ===\n{}\n=== END CHAT HISTORY ===",
+            lambda: user_id,
+            lambda: "\n".join(
+                f"[{idx}] {msg.role}: {msg.content}"
+                for idx, msg in enumerate(user_context.chatHistory)
+            )
+        )
         
         # Step 7: Check if summarization is needed
-        needs_summarization, _ = await cache_manager.check_and_summarize(
-            user_id=user_id,
-            context=user_context,
-            max_messages=settings.previous_message_context_length,
+        needs_summarization = cache_manager.needs_summarization(
+            user_context,
+            max_messages=max_context,
             overlap=settings.overlap_count
         )
         
@@ -329,7 +466,6 @@ async def chat_endpoint(request: Request, chat_request: ChatRequest) -> ChatResp
             logger.info(f"Triggering summarization for user_id={user_id}")
             
             # Calculate how many messages to summarize
-            threshold = settings.previous_message_context_length + settings.overlap_count
             overflow_count = len(user_context.chatHistory) - threshold
             messages_to_summarize = user_context.chatHistory[:overflow_count]
             
@@ -349,7 +485,7 @@ async def chat_endpoint(request: Request, chat_request: ChatRequest) -> ChatResp
             user_context.userSummary = summary
             
             # Trim chat history to keep only recent messages
-            user_context.chatHistory = user_context.chatHistory[-settings.previous_message_context_length:]
+            user_context.trim_history(max_context)
             
             logger.info(
                 f"Summarization complete: user_id={user_id}, "
@@ -358,29 +494,23 @@ async def chat_endpoint(request: Request, chat_request: ChatRequest) -> ChatResp
             )
         
         # Step 8: Update cache and database
+        # The cache is updated before responding so the user's next request sees this turn
         await cache_manager.set(user_id, user_context)
         
-        # Convert chat history to JSON string format for database
-        import json
-        chat_history_dict = [
-            json.dumps({"role": msg.role, "content": msg.content})
-            for msg in user_context.chatHistory
-        ]
-        
-        # Check if user exists in database
-        existing_user = await db_service.get_user_context(user_id)
-        
-        if existing_user is None:
-            # Create new user in database
-            await db_service.create_user_context(user_id, user_context)
-        else:
-            # Update existing user
-            await db_service.update_chat_history(
-                user_id=user_id,
-                chat_history=chat_history_dict,
-                user_summary=user_context.userSummary,
-                chat_interest=user_context.chatInterest
+        # Convert chat history to the database format (one orjson string per message).
+        # Large histories are encoded on a worker thread to keep the event loop free
+        history_chars = sum(len(msg.content) for msg in user_context.chatHistory)
+        if history_chars > ENCODE_OFFLOAD_CHARS:
+            chat_history_dict = await asyncio.to_thread(
+                encode_chat_history, list(user_context.chatHistory)
             )
+        else:
+            chat_history_dict = encode_chat_history(user_context.chatHistory)
+        
+        # The database write runs after the response is sent
+        background_tasks.add_task(
+            persist_chat_turn, user_id, user_context, chat_history_dict, user_existed_in_db
+        )
         
         logger.info(f"Chat request completed successfully for user_id={user_id}")
         
@@ -392,7 +522,6 @@ async def chat_endpoint(request: Request, chat_request: ChatRequest) -> ChatResp
         raise
     except Exception as e:
         # Log error with comprehensive context
-        import traceback
         tb = traceback.format_exc()
         
         logger.error(
@@ -71,34 +71,42 @@ async def wait_for_server(url: str, timeout: int = 30):
     
     start_time = time.time()
     
-    while time.time() - start_time < timeout:
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{url}/health", timeout=5.0)
+    # One client for all polls so a kept-alive connection is reused
+    async with httpx.AsyncClient(timeout=5.0) as client:
+        while time.time() - start_time < timeout:
+            try:
+                response = await client.get(f"{url}/health")
                 if response.status_code == 200:
                     print("✓ Server is ready")
                     return True
-        except:
-            pass
-        
-        await asyncio.sleep(1)
+            except httpx.HTTPError:
+                pass
+            
+            await asyncio.sleep(1)
     
     print("❌ Server failed to start within timeout")
     return False
 
 
+SERVER_LOG = "server.log"
+
+
 def start_server():
     """Start the FastAPI server in the background."""
     print("Starting FastAPI server...")
     
-    # Start uvicorn in a subprocess
-    process = subprocess.Popen(
-        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", "8000"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True
-    )
+    # Start uvicorn in a subprocess. Its output goes to a file: pipes that are
+    # never read fill up and block the server once it has logged ~64KB.
+    # uvicorn's default "auto" loop/http already pick uvloop and httptools
+    # where they are installed.
+    with open(SERVER_LOG, "wb") as log_file:
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", "8000"],
+            stdout=log_file,
+            stderr=subprocess.STDOUT
+        )
     
+    print(f"Server output: {SERVER_LOG}")
     return process
 
 
@@ -0,0 +1,24 @@
+"""Shared pytest fixtures."""
+
+import asyncio
+import pytest
+
+try:
+    import uvloop
+except ImportError:  # uvloop ships with uvicorn[standard] on Linux/macOS only
+    uvloop = None
+
+
+@pytest.fixture(scope="session")
+def event_loop():
+    """
+    Provide one event loop for the whole test session.
+    
+    Overrides pytest-asyncio's per-test loop so async tests do not each pay
+    for a loop bootstrap; they only await mocks and clean up their own tasks.
+    Uses uvloop when it is installed.
+    """
+    policy = uvloop.EventLoopPolicy() if uvloop is not None else asyncio.DefaultEventLoopPolicy()
+    loop = policy.new_event_loop()
+    yield loop
+    loop.close()
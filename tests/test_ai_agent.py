@@ -2,12 +2,15 @@
 
 import pytest
 import asyncio
+from types import SimpleNamespace
 from unittest.mock import AsyncMock, MagicMock, patch
-from app.ai_agent import AIAgent
+from app.ai_agent import AIAgent, _build_system_prompt_cached
 from app.models import UserContext, Message
 
 
-@pytest.fixture
+# The user contexts are built once per session and shared. UserContext is
+# mutable (chat_endpoint appends to it), so tests must treat them as read-only.
+@pytest.fixture(scope="session")
 def user_context_first_time():
     """Create a user context for first-time user."""
     return UserContext(
@@ -19,7 +22,7 @@ def user_context_first_time():
     )
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def user_context_returning():
     """Create a user context for returning user."""
     return UserContext(
@@ -34,28 +37,85 @@ def user_context_returning():
     )
 
 
-@pytest.fixture
+SEARCH_RESULTS = [
+    {
+        "title": "Python Tutorial",
+        "url": "https://example.com/python",
+        "description": "Learn Python programming"
+    },
+    {
+        "title": "Python Documentation",
+        "url": "https://docs.python.org",
+        "description": "Official Python docs"
+    }
+]
+
+
+# Substrings the system prompt must contain for the shared user contexts
+FIRST_TIME_PROMPT_PARTS = frozenset({
+    "highly capable AI assistant",
+    "### Current Interaction Focus",
+    "**Python programming**",
+    "### User Interests & Topics",
+    "**programming, AI, web development**",
+    "###User's birthdate: 1990-01-15",
+    "Use **Markdown**",
+})
+RETURNING_PROMPT_PARTS = FIRST_TIME_PROMPT_PARTS | {
+    "### Previous Conversation Context",
+    "**Summary of history:** User is learning Python",
+}
+
+
+def _missing_parts(prompt, parts):
+    """Return the required substrings absent from prompt, so a failure lists all of them."""
+    return {part for part in parts if part not in prompt}
+
+
+def _make_openai_response(content=None, fn_name=None, fn_args=None):
+    """Build a chat completion response as plain namespaces instead of MagicMock chains."""
+    function_call = (
+        SimpleNamespace(name=fn_name, arguments=fn_args) if fn_name is not None else None
+    )
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content, function_call=function_call))],
+        usage=SimpleNamespace(prompt_tokens=0, completion_tokens=0, total_tokens=0)
+    )
+
+
+def _make_gemini_response(*parts):
+    """Build a Gemini generate_content response holding the given parts."""
+    return SimpleNamespace(
+        candidates=[SimpleNamespace(content=SimpleNamespace(parts=list(parts)))],
+        usage_metadata=SimpleNamespace(
+            prompt_token_count=0,
+            candidates_token_count=0,
+            total_token_count=0
+        )
+    )
+
+
+def _fake_create(*responses):
+    """Return a create() stand-in that yields the given responses in order."""
+    remaining = iter(responses)
+    
+    async def create(*args, **kwargs):
+        return next(remaining)
+    
+    return create
+
+
+@pytest.fixture(scope="module")
 def mock_search_service():
-    """Create a mock search service."""
+    """Create a mock search service shared by the module's tests."""
     service = MagicMock()
-    service.search = AsyncMock(return_value=[
-        {
-            "title": "Python Tutorial",
-            "url": "https://example.com/python",
-            "description": "Learn Python programming"
-        },
-        {
-            "title": "Python Documentation",
-            "url": "https://docs.python.org",
-            "description": "Official Python docs"
-        }
-    ])
+    service.search = AsyncMock(return_value=list(SEARCH_RESULTS))
     return service
 
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def ai_agent(mock_search_service):
-    """Create an AIAgent instance for testing."""
+    """Create an AIAgent instance shared by the module's tests."""
     return AIAgent(
         openai_key="test_openai_key",
         gemini_key="test_gemini_key",
@@ -64,6 +124,29 @@ def ai_agent(mock_search_service):
     )
 
 
+@pytest.fixture
+def gemini_model(ai_agent, reset_shared_fixtures):
+    """Install a mock Gemini model on the shared agent; reset_shared_fixtures restores the real one."""
+    model = MagicMock()
+    model.generate_content_async = AsyncMock()
+    ai_agent._gemini_model = model
+    return model
+
+
+@pytest.fixture(autouse=True)
+def reset_shared_fixtures(ai_agent, mock_search_service):
+    """Undo the per-test patches on the module-scoped agent and search service."""
+    real_gemini_model = ai_agent._gemini_model
+    yield
+    vars(ai_agent).pop("_call_openai", None)
+    vars(ai_agent.openai_client.chat.completions).pop("create", None)
+    ai_agent._gemini_model = real_gemini_model
+    ai_agent.search_service = mock_search_service
+    ai_agent._response_cache.clear()
+    mock_search_service.reset_mock()
+    mock_search_service.search = AsyncMock(return_value=list(SEARCH_RESULTS))
+
+
 class TestAIAgent:
     """Tests for AIAgent class."""
     
@@ -94,21 +177,30 @@ class TestAIAgent:
         """Test prompt building for first-time user."""
         prompt = ai_agent._build_system_prompt(user_context_first_time, is_first_message=True)
         
-        assert "helpful and personalized AI assistant" in prompt
-        assert "Python programming" in prompt
-        assert "programming, AI, web development" in prompt
-        assert "1990-01-15" in prompt
-        assert "Previous conversation summary" not in prompt  # First-time user
+        assert _missing_parts(prompt, FIRST_TIME_PROMPT_PARTS) == set()
+        assert "### Previous Conversation Context" not in prompt  # First-time user
     
     def test_build_system_prompt_returning_user(self, ai_agent, user_context_returning):
         """Test prompt building for returning user with summary."""
         prompt = ai_agent._build_system_prompt(user_context_returning, is_first_message=False)
         
-        assert "helpful and personalized AI assistant" in prompt
-        assert "Python programming" in prompt
-        assert "Previous conversation summary" in prompt
-        assert "User is learning Python" in prompt
-        assert "Markdown format" in prompt
+        assert _missing_parts(prompt, RETURNING_PROMPT_PARTS) == set()
+    
+    def test_build_system_prompt_memoized_for_returning_user(
+        self, ai_agent, user_context_first_time, user_context_returning
+    ):
+        """Test returning-user prompts are served from the LRU cache and first-message prompts bypass it."""
+        first = ai_agent._build_system_prompt(user_context_returning, is_first_message=False)
+        hits = _build_system_prompt_cached.cache_info().hits
+        
+        second = ai_agent._build_system_prompt(user_context_returning, is_first_message=False)
+        
+        assert second is first
+        assert _build_system_prompt_cached.cache_info().hits == hits + 1
+        
+        info = _build_system_prompt_cached.cache_info()
+        ai_agent._build_system_prompt(user_context_first_time, is_first_message=True)
+        assert _build_system_prompt_cached.cache_info() == info
     
     def test_build_system_prompt_minimal_context(self, ai_agent):
         """Test prompt building with minimal user context."""
@@ -122,22 +214,16 @@ class TestAIAgent:
         
         prompt = ai_agent._build_system_prompt(minimal_context, is_first_message=True)
         
-        assert "helpful and personalized AI assistant" in prompt
-        assert "Markdown format" in prompt
+        assert "highly capable AI assistant" in prompt
+        assert "Use **Markdown**" in prompt
+        assert "### Current Interaction Focus" not in prompt
+        assert "### User Interests & Topics" not in prompt
 
     @pytest.mark.asyncio
     async def test_call_openai_success(self, ai_agent):
         """Test successful OpenAI API call."""
         # Mock OpenAI response
-        mock_response = MagicMock()
-        mock_response.choices = [MagicMock()]
-        mock_response.choices[0].message = MagicMock()
-        mock_response.choices[0].message.content = "This is a test response from OpenAI."
-        mock_response.choices[0].message.function_call = None
-        mock_response.usage = MagicMock()
-        mock_response.usage.prompt_tokens = 50
-        mock_response.usage.completion_tokens = 20
-        mock_response.usage.total_tokens = 70
+        mock_response = _make_openai_response("This is a test response from OpenAI.")
         
         ai_agent.openai_client.chat.completions.create = AsyncMock(return_value=mock_response)
         
@@ -149,22 +235,24 @@ class TestAIAgent:
         assert response_text == "This is a test response from OpenAI."
         assert function_call is None
         ai_agent.openai_client.chat.completions.create.assert_called_once()
+        
+        call_kwargs = ai_agent.openai_client.chat.completions.create.call_args.kwargs
+        prompt_cache_key = call_kwargs["extra_body"]["prompt_cache_key"]
+        assert prompt_cache_key
+        
+        # Same system prompt keeps the key stable across turns
+        await ai_agent._call_openai(messages + [{"role": "assistant", "content": "Hi"}], system_prompt)
+        call_kwargs = ai_agent.openai_client.chat.completions.create.call_args.kwargs
+        assert call_kwargs["extra_body"]["prompt_cache_key"] == prompt_cache_key
     
     @pytest.mark.asyncio
     async def test_call_openai_with_function_call(self, ai_agent):
         """Test OpenAI API call with function calling."""
         # Mock OpenAI response with function call
-        mock_response = MagicMock()
-        mock_response.choices = [MagicMock()]
-        mock_response.choices[0].message = MagicMock()
-        mock_response.choices[0].message.content = None
-        mock_response.choices[0].message.function_call = MagicMock()
-        mock_response.choices[0].message.function_call.name = "web_search"
-        mock_response.choices[0].message.function_call.arguments = '{"query": "Python tutorials", "count": 5}'
-        mock_response.usage = MagicMock()
-        mock_response.usage.prompt_tokens = 60
-        mock_response.usage.completion_tokens = 15
-        mock_response.usage.total_tokens = 75
+        mock_response = _make_openai_response(
+            fn_name="web_search",
+            fn_args='{"query": "Python tutorials", "count": 5}'
+        )
         
         ai_agent.openai_client.chat.completions.create = AsyncMock(return_value=mock_response)
         
@@ -180,72 +268,43 @@ class TestAIAgent:
         assert function_call["arguments"]["count"] == 5
     
     @pytest.mark.asyncio
-    async def test_call_gemini_success(self, ai_agent):
+    async def test_call_gemini_success(self, ai_agent, gemini_model):
         """Test successful Gemini API call."""
-        # Mock Gemini response with proper text attribute
-        mock_part = MagicMock()
-        mock_part.text = "This is a test response from Gemini."
-        # Ensure hasattr(part, 'text') returns True
-        type(mock_part).text = property(lambda self: "This is a test response from Gemini.")
-        # No function_call attribute
-        mock_part.function_call = None
-        
-        mock_response = MagicMock()
-        mock_response.candidates = [MagicMock()]
-        mock_response.candidates[0].content = MagicMock()
-        mock_response.candidates[0].content.parts = [mock_part]
-        mock_response.usage_metadata = MagicMock()
-        mock_response.usage_metadata.prompt_token_count = 45
-        mock_response.usage_metadata.candidates_token_count = 18
-        mock_response.usage_metadata.total_token_count = 63
-        
-        with patch('google.generativeai.GenerativeModel') as mock_model_class:
-            mock_model = MagicMock()
-            mock_model.generate_content_async = AsyncMock(return_value=mock_response)
-            mock_model_class.return_value = mock_model
-            
-            messages = [{"role": "user", "content": "Hello"}]
-            system_prompt = "You are a helpful assistant."
-            
-            response_text, function_call = await ai_agent._call_gemini(messages, system_prompt)
-            
-            assert response_text == "This is a test response from Gemini."
-            assert function_call is None
+        mock_response = _make_gemini_response(
+            SimpleNamespace(text="This is a test response from Gemini.", function_call=None)
+        )
+        
+        gemini_model.generate_content_async.return_value = mock_response
+        
+        messages = [{"role": "user", "content": "Hello"}]
+        system_prompt = "You are a helpful assistant."
+        
+        response_text, function_call = await ai_agent._call_gemini(messages, system_prompt)
+        
+        assert response_text == "This is a test response from Gemini."
+        assert function_call is None
     
     @pytest.mark.asyncio
-    async def test_call_gemini_with_function_call(self, ai_agent):
+    async def test_call_gemini_with_function_call(self, ai_agent, gemini_model):
         """Test Gemini API call with function calling."""
-        # Mock Gemini response with function call
-        mock_function_call = MagicMock()
-        mock_function_call.name = "web_search"
-        mock_function_call.args = {"query": "AI news", "count": 3}
-        
-        mock_part = MagicMock()
-        mock_part.function_call = mock_function_call
-        
-        mock_response = MagicMock()
-        mock_response.candidates = [MagicMock()]
-        mock_response.candidates[0].content = MagicMock()
-        mock_response.candidates[0].content.parts = [mock_part]
-        mock_response.usage_metadata = MagicMock()
-        mock_response.usage_metadata.prompt_token_count = 55
-        mock_response.usage_metadata.candidates_token_count = 12
-        mock_response.usage_metadata.total_token_count = 67
-        
-        with patch('google.generativeai.GenerativeModel') as mock_model_class:
-            mock_model = MagicMock()
-            mock_model.generate_content_async = AsyncMock(return_value=mock_response)
-            mock_model_class.return_value = mock_model
-            
-            messages = [{"role": "user", "content": "Search for AI news"}]
-            system_prompt = "You are a helpful assistant."
-            
-            response_text, function_call = await ai_agent._call_gemini(messages, system_prompt)
-            
-            assert response_text == ""
-            assert function_call is not None
-            assert function_call["name"] == "web_search"
-            assert function_call["arguments"]["query"] == "AI news"
+        mock_response = _make_gemini_response(
+            SimpleNamespace(function_call=SimpleNamespace(
+                name="web_search",
+                args={"query": "AI news", "count": 3}
+            ))
+        )
+        
+        gemini_model.generate_content_async.return_value = mock_response
+        
+        messages = [{"role": "user", "content": "Search for AI news"}]
+        system_prompt = "You are a helpful assistant."
+        
+        response_text, function_call = await ai_agent._call_gemini(messages, system_prompt)
+        
+        assert response_text == ""
+        assert function_call is not None
+        assert function_call["name"] == "web_search"
+        assert function_call["arguments"]["query"] == "AI news"
 
     @pytest.mark.asyncio
     async def test_handle_function_call_web_search(self, ai_agent, mock_search_service):
@@ -308,93 +367,121 @@ class TestAIAgent:
         assert "Function call failed" in result
     
     @pytest.mark.asyncio
-    async def test_generate_response_openai(self, ai_agent, user_context_first_time):
+    @pytest.mark.parametrize("messages, provider, expected", [
+        ([{"role": "user", "content": "Hello"}], "openai", "Hello! How can I help you?"),
+        # No provider falls back to the default (openai)
+        ([{"role": "user", "content": "Test"}], None, "Default provider response."),
+        ([], "openai", "Response to empty messages"),
+    ], ids=["explicit_provider", "default_provider", "empty_messages"])
+    async def test_generate_response_openai(self, ai_agent, user_context_first_time, messages, provider, expected):
         """Test generating response with OpenAI."""
-        # Mock OpenAI response
-        mock_response = MagicMock()
-        mock_response.choices = [MagicMock()]
-        mock_response.choices[0].message = MagicMock()
-        mock_response.choices[0].message.content = "Hello! How can I help you?"
-        mock_response.choices[0].message.function_call = None
-        mock_response.usage = MagicMock()
-        mock_response.usage.prompt_tokens = 40
-        mock_response.usage.completion_tokens = 10
-        mock_response.usage.total_tokens = 50
+        ai_agent.openai_client.chat.completions.create = AsyncMock(
+            return_value=_make_openai_response(expected)
+        )
+        
+        response_text, updated_messages = await ai_agent.generate_response(
+            messages, "You are helpful.", user_context_first_time, provider=provider
+        )
+        
+        assert response_text == expected
+        assert updated_messages == messages  # No function calls
+        ai_agent.openai_client.chat.completions.create.assert_called_once()
+    
+    @pytest.mark.asyncio
+    async def test_generate_response_uses_response_cache(self, ai_agent, user_context_first_time):
+        """Test that an identical prompt and history is served from the response cache."""
+        mock_response = _make_openai_response("Hello! How can I help you?")
         
         ai_agent.openai_client.chat.completions.create = AsyncMock(return_value=mock_response)
         
         messages = [{"role": "user", "content": "Hello"}]
         system_prompt = "You are helpful."
         
-        response_text, updated_messages = await ai_agent.generate_response(
+        first, _ = await ai_agent.generate_response(
+            messages, system_prompt, user_context_first_time, provider="openai"
+        )
+        second, updated_messages = await ai_agent.generate_response(
             messages, system_prompt, user_context_first_time, provider="openai"
         )
         
-        assert response_text == "Hello! How can I help you?"
-        assert updated_messages == messages  # No function calls
+        assert first == second == "Hello! How can I help you?"
+        assert updated_messages == messages
+        ai_agent.openai_client.chat.completions.create.assert_called_once()
+    
+    @pytest.mark.asyncio
+    async def test_semantic_cache_scoped_per_user_and_context(self, user_context_first_time):
+        """Test semantic cache hits span turns of a conversation but never users or contexts."""
+        agent = AIAgent(
+            openai_key="test_openai",
+            gemini_key="test_gemini",
+            response_cache_size=0,
+            semantic_cache_threshold=0.9
+        )
+        # Every message embeds to the same vector, i.e. is a near-duplicate
+        agent._semantic_cache._embed = AsyncMock(return_value=[1.0, 0.0])
+        agent.openai_client.chat.completions.create = _fake_create(
+            _make_openai_response("Answer for alice"),
+            _make_openai_response("Answer for bob"),
+            _make_openai_response("Answer with a new summary")
+        )
+        system_prompt = "You are helpful."
+        first_turn = [{"role": "user", "content": "What is Python?"}]
+        
+        alice, _ = await agent.generate_response(
+            first_turn, system_prompt, user_context_first_time, user_id="alice"
+        )
+        # The next turn of the same conversation: the history window has grown
+        next_turn, _ = await agent.generate_response(
+            first_turn + [
+                {"role": "assistant", "content": alice},
+                {"role": "user", "content": "what is python"}
+            ],
+            system_prompt, user_context_first_time, user_id="alice"
+        )
+        bob, _ = await agent.generate_response(
+            first_turn, system_prompt, user_context_first_time, user_id="bob"
+        )
+        new_summary, _ = await agent.generate_response(
+            first_turn, "You are helpful. Summary: prefers Rust.",
+            user_context_first_time, user_id="alice"
+        )
+        
+        assert alice == next_turn == "Answer for alice"
+        assert bob == "Answer for bob"
+        assert new_summary == "Answer with a new summary"
     
     @pytest.mark.asyncio
-    async def test_generate_response_gemini(self, ai_agent, user_context_first_time):
+    async def test_generate_response_gemini(self, ai_agent, gemini_model, user_context_first_time):
         """Test generating response with Gemini."""
-        # Mock Gemini response with proper text attribute
-        mock_part = MagicMock()
-        type(mock_part).text = property(lambda self: "Gemini response here.")
-        mock_part.function_call = None
-        
-        mock_response = MagicMock()
-        mock_response.candidates = [MagicMock()]
-        mock_response.candidates[0].content = MagicMock()
-        mock_response.candidates[0].content.parts = [mock_part]
-        mock_response.usage_metadata = MagicMock()
-        mock_response.usage_metadata.prompt_token_count = 35
-        mock_response.usage_metadata.candidates_token_count = 8
-        mock_response.usage_metadata.total_token_count = 43
-        
-        with patch('google.generativeai.GenerativeModel') as mock_model_class:
-            mock_model = MagicMock()
-            mock_model.generate_content_async = AsyncMock(return_value=mock_response)
-            mock_model_class.return_value = mock_model
-            
-            messages = [{"role": "user", "content": "Hello"}]
-            system_prompt = "You are helpful."
-            
-            response_text, updated_messages = await ai_agent.generate_response(
-                messages, system_prompt, user_context_first_time, provider="gemini"
-            )
-            
-            assert response_text == "Gemini response here."
-            assert updated_messages == messages
+        mock_response = _make_gemini_response(
+            SimpleNamespace(text="Gemini response here.", function_call=None)
+        )
+        
+        gemini_model.generate_content_async.return_value = mock_response
+        
+        messages = [{"role": "user", "content": "Hello"}]
+        system_prompt = "You are helpful."
+        
+        response_text, updated_messages = await ai_agent.generate_response(
+            messages, system_prompt, user_context_first_time, provider="gemini"
+        )
+        
+        assert response_text == "Gemini response here."
+        assert updated_messages == messages
 
     @pytest.mark.asyncio
     async def test_generate_response_with_function_calling(self, ai_agent, user_context_first_time, mock_search_service):
         """Test generating response with function calling flow."""
         # First call returns function call
-        mock_response_1 = MagicMock()
-        mock_response_1.choices = [MagicMock()]
-        mock_response_1.choices[0].message = MagicMock()
-        mock_response_1.choices[0].message.content = None
-        mock_response_1.choices[0].message.function_call = MagicMock()
-        mock_response_1.choices[0].message.function_call.name = "web_search"
-        mock_response_1.choices[0].message.function_call.arguments = '{"query": "Python", "count": 2}'
-        mock_response_1.usage = MagicMock()
-        mock_response_1.usage.prompt_tokens = 50
-        mock_response_1.usage.completion_tokens = 15
-        mock_response_1.usage.total_tokens = 65
+        mock_response_1 = _make_openai_response(
+            fn_name="web_search",
+            fn_args='{"query": "Python", "count": 2}'
+        )
         
         # Second call returns final response
-        mock_response_2 = MagicMock()
-        mock_response_2.choices = [MagicMock()]
-        mock_response_2.choices[0].message = MagicMock()
-        mock_response_2.choices[0].message.content = "Based on search results, Python is great!"
-        mock_response_2.choices[0].message.function_call = None
-        mock_response_2.usage = MagicMock()
-        mock_response_2.usage.prompt_tokens = 100
-        mock_response_2.usage.completion_tokens = 25
-        mock_response_2.usage.total_tokens = 125
+        mock_response_2 = _make_openai_response("Based on search results, Python is great!")
         
-        ai_agent.openai_client.chat.completions.create = AsyncMock(
-            side_effect=[mock_response_1, mock_response_2]
-        )
+        ai_agent.openai_client.chat.completions.create = _fake_create(mock_response_1, mock_response_2)
         
         messages = [{"role": "user", "content": "Tell me about Python"}]
         system_prompt = "You are helpful."
@@ -406,33 +493,70 @@ class TestAIAgent:
         assert response_text == "Based on search results, Python is great!"
         assert len(updated_messages) > len(messages)  # Function call added
         mock_search_service.search.assert_called_once()
-    
+
     @pytest.mark.asyncio
-    async def test_generate_response_default_provider(self, ai_agent, user_context_first_time):
-        """Test generating response uses default provider."""
-        mock_response = MagicMock()
-        mock_response.choices = [MagicMock()]
-        mock_response.choices[0].message = MagicMock()
-        mock_response.choices[0].message.content = "Default provider response."
-        mock_response.choices[0].message.function_call = None
-        mock_response.usage = MagicMock()
-        mock_response.usage.prompt_tokens = 30
-        mock_response.usage.completion_tokens = 8
-        mock_response.usage.total_tokens = 38
-        
-        ai_agent.openai_client.chat.completions.create = AsyncMock(return_value=mock_response)
-        
-        messages = [{"role": "user", "content": "Test"}]
-        system_prompt = "You are helpful."
-        
-        # Don't specify provider - should use default (openai)
-        response_text, _ = await ai_agent.generate_response(
-            messages, system_prompt, user_context_first_time
+    async def test_generate_response_reuses_speculative_search(self, ai_agent, user_context_first_time, mock_search_service):
+        """Test that a search-like message reuses the speculatively started search."""
+        mock_response_1 = _make_openai_response(
+            fn_name="web_search",
+            fn_args='{"query": "latest Python news"}'
         )
-        
-        assert response_text == "Default provider response."
-        ai_agent.openai_client.chat.completions.create.assert_called_once()
-    
+
+        mock_response_2 = _make_openai_response("Python 3.13 is out!")
+
+        ai_agent.openai_client.chat.completions.create = _fake_create(mock_response_1, mock_response_2)
+
+        messages = [{"role": "user", "content": "latest Python news"}]
+
+        response_text, updated_messages = await ai_agent.generate_response(
+            messages, "You are helpful.", user_context_first_time, provider="openai"
+        )
+
+        assert response_text == "Python 3.13 is out!"
+        assert "Python Tutorial" in updated_messages[-1]["content"]
+        mock_search_service.search.assert_called_once_with("latest Python news", 5)
+
+    @pytest.mark.asyncio
+    async def test_generate_response_stream_with_function_calling(self, ai_agent, user_context_first_time, mock_search_service):
+        """Test streaming a response that goes through a function call."""
+        def make_chunk(content=None, name=None, arguments=None):
+            chunk = MagicMock()
+            chunk.choices = [MagicMock()]
+            delta = chunk.choices[0].delta
+            delta.content = content
+            if name is None and arguments is None:
+                delta.function_call = None
+            else:
+                delta.function_call.name = name
+                delta.function_call.arguments = arguments
+            return chunk
+
+        async def stream(chunks):
+            for chunk in chunks:
+                yield chunk
+
+        ai_agent.openai_client.chat.completions.create = AsyncMock(side_effect=[
+            stream([
+                make_chunk(name="web_search", arguments='{"query": '),
+                make_chunk(arguments='"Python"}')
+            ]),
+            stream([make_chunk(content="Python "), make_chunk(content="is great!")])
+        ])
+
+        messages = [{"role": "user", "content": "Tell me about Python"}]
+
+        chunks = [
+            chunk async for chunk in ai_agent.generate_response_stream(
+                messages, "You are helpful.", user_context_first_time, provider="openai"
+            )
+        ]
+
+        assert chunks == ["Python ", "is great!"]
+        mock_search_service.search.assert_called_once_with("Python", 5)
+        second_call = ai_agent.openai_client.chat.completions.create.call_args_list[1]
+        assert second_call.kwargs["stream"] is True
+        assert second_call.kwargs["messages"][-1]["role"] == "function"
+
     @pytest.mark.asyncio
     async def test_generate_response_invalid_provider(self, ai_agent, user_context_first_time):
         """Test generating response with invalid provider."""
@@ -454,15 +578,9 @@ class TestAIAgent:
             {"role": "assistant", "content": "It's versatile and easy to learn."}
         ]
         
-        mock_response = MagicMock()
-        mock_response.choices = [MagicMock()]
-        mock_response.choices[0].message = MagicMock()
-        mock_response.choices[0].message.content = "User asked about Python. Assistant explained it's a versatile programming language."
-        mock_response.choices[0].message.function_call = None
-        mock_response.usage = MagicMock()
-        mock_response.usage.prompt_tokens = 80
-        mock_response.usage.completion_tokens = 20
-        mock_response.usage.total_tokens = 100
+        mock_response = _make_openai_response(
+            "User asked about Python. Assistant explained it's a versatile programming language."
+        )
         
         ai_agent.openai_client.chat.completions.create = AsyncMock(return_value=mock_response)
         
@@ -473,36 +591,23 @@ class TestAIAgent:
         ai_agent.openai_client.chat.completions.create.assert_called_once()
     
     @pytest.mark.asyncio
-    async def test_summarize_messages_gemini(self, ai_agent):
+    async def test_summarize_messages_gemini(self, ai_agent, gemini_model):
         """Test message summarization with Gemini."""
         messages = [
             {"role": "user", "content": "Explain AI"},
             {"role": "assistant", "content": "AI is artificial intelligence."}
         ]
         
-        # Mock Gemini response with proper text attribute
-        mock_part = MagicMock()
-        type(mock_part).text = property(lambda self: "User learned about AI basics.")
-        mock_part.function_call = None
-        
-        mock_response = MagicMock()
-        mock_response.candidates = [MagicMock()]
-        mock_response.candidates[0].content = MagicMock()
-        mock_response.candidates[0].content.parts = [mock_part]
-        mock_response.usage_metadata = MagicMock()
-        mock_response.usage_metadata.prompt_token_count = 60
-        mock_response.usage_metadata.candidates_token_count = 15
-        mock_response.usage_metadata.total_token_count = 75
-        
-        with patch('google.generativeai.GenerativeModel') as mock_model_class:
-            mock_model = MagicMock()
-            mock_model.generate_content_async = AsyncMock(return_value=mock_response)
-            mock_model_class.return_value = mock_model
-            
-            summary = await ai_agent.summarize_messages(messages, provider="gemini")
-            
-            assert "AI" in summary
-            assert "basics" in summary
+        mock_response = _make_gemini_response(
+            SimpleNamespace(text="User learned about AI basics.", function_call=None)
+        )
+        
+        gemini_model.generate_content_async.return_value = mock_response
+        
+        summary = await ai_agent.summarize_messages(messages, provider="gemini")
+        
+        assert "AI" in summary
+        assert "basics" in summary
 
     @pytest.mark.asyncio
     async def test_summarize_messages_failure(self, ai_agent):
@@ -520,6 +625,28 @@ class TestAIAgent:
         # Should return basic summary on failure
         assert "1 messages" in summary
     
+    @pytest.mark.asyncio
+    async def test_summarize_messages_batch(self, ai_agent):
+        """Test batch summarization keeps item order and bounds concurrency."""
+        in_flight = 0
+        max_in_flight = 0
+
+        async def fake_call(messages, system_prompt):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0)
+            in_flight -= 1
+            return f"summary of {messages[0]['content'][-1]}", None
+
+        ai_agent._call_openai = fake_call
+        items = [([{"role": "user", "content": f"message {i}"}], None) for i in range(5)]
+
+        summaries = await ai_agent.summarize_messages_batch(items, provider="openai", concurrency=2)
+
+        assert summaries == [f"summary of {i}" for i in range(5)]
+        assert max_in_flight <= 2
+    
     @pytest.mark.asyncio
     async def test_retry_logic_on_api_failure(self, ai_agent, user_context_first_time):
         """Test retry logic when API calls fail."""
@@ -532,16 +659,7 @@ class TestAIAgent:
             if call_count < 3:
                 raise Exception("Temporary API error")
             
-            mock_response = MagicMock()
-            mock_response.choices = [MagicMock()]
-            mock_response.choices[0].message = MagicMock()
-            mock_response.choices[0].message.content = "Success after retries"
-            mock_response.choices[0].message.function_call = None
-            mock_response.usage = MagicMock()
-            mock_response.usage.prompt_tokens = 40
-            mock_response.usage.completion_tokens = 10
-            mock_response.usage.total_tokens = 50
-            return mock_response
+            return _make_openai_response("Success after retries")
         
         ai_agent.openai_client.chat.completions.create = mock_create
         
@@ -571,63 +689,23 @@ class TestAIAgent:
             )
     
     @pytest.mark.asyncio
-    async def test_empty_messages_list(self, ai_agent, user_context_first_time):
-        """Test handling empty messages list."""
-        mock_response = MagicMock()
-        mock_response.choices = [MagicMock()]
-        mock_response.choices[0].message = MagicMock()
-        mock_response.choices[0].message.content = "Response to empty messages"
-        mock_response.choices[0].message.function_call = None
-        mock_response.usage = MagicMock()
-        mock_response.usage.prompt_tokens = 20
-        mock_response.usage.completion_tokens = 5
-        mock_response.usage.total_tokens = 25
+    async def test_multiple_text_parts_gemini(self, ai_agent, gemini_model, user_context_first_time):
+        """Test Gemini response with multiple text parts."""
+        mock_response = _make_gemini_response(
+            SimpleNamespace(text="First part. ", function_call=None),
+            SimpleNamespace(text="Second part.", function_call=None)
+        )
         
-        ai_agent.openai_client.chat.completions.create = AsyncMock(return_value=mock_response)
+        gemini_model.generate_content_async.return_value = mock_response
         
-        messages = []
+        messages = [{"role": "user", "content": "Test"}]
         system_prompt = "You are helpful."
         
         response_text, _ = await ai_agent.generate_response(
-            messages, system_prompt, user_context_first_time, provider="openai"
+            messages, system_prompt, user_context_first_time, provider="gemini"
         )
         
-        assert response_text == "Response to empty messages"
-    
-    @pytest.mark.asyncio
-    async def test_multiple_text_parts_gemini(self, ai_agent, user_context_first_time):
-        """Test Gemini response with multiple text parts."""
-        # Mock Gemini response with multiple text parts
-        mock_part1 = MagicMock()
-        type(mock_part1).text = property(lambda self: "First part. ")
-        mock_part1.function_call = None
-        
-        mock_part2 = MagicMock()
-        type(mock_part2).text = property(lambda self: "Second part.")
-        mock_part2.function_call = None
-        
-        mock_response = MagicMock()
-        mock_response.candidates = [MagicMock()]
-        mock_response.candidates[0].content = MagicMock()
-        mock_response.candidates[0].content.parts = [mock_part1, mock_part2]
-        mock_response.usage_metadata = MagicMock()
-        mock_response.usage_metadata.prompt_token_count = 30
-        mock_response.usage_metadata.candidates_token_count = 10
-        mock_response.usage_metadata.total_token_count = 40
-        
-        with patch('google.generativeai.GenerativeModel') as mock_model_class:
-            mock_model = MagicMock()
-            mock_model.generate_content_async = AsyncMock(return_value=mock_response)
-            mock_model_class.return_value = mock_model
-            
-            messages = [{"role": "user", "content": "Test"}]
-            system_prompt = "You are helpful."
-            
-            response_text, _ = await ai_agent.generate_response(
-                messages, system_prompt, user_context_first_time, provider="gemini"
-            )
-            
-            assert response_text == "First part. Second part."
+        assert response_text == "First part. Second part."
     
     def test_function_schema_structure(self, ai_agent):
         """Test that function schema is properly structured."""
@@ -640,3 +718,10 @@ class TestAIAgent:
         assert "query" in schema["parameters"]["properties"]
         assert "count" in schema["parameters"]["properties"]
         assert "query" in schema["parameters"]["required"]
+    
+    def test_function_schema_shared_and_read_only(self, ai_agent):
+        """Test that the schema is one class-level mapping, not rebuilt per instance."""
+        assert ai_agent.function_schema is AIAgent.function_schema
+        
+        with pytest.raises(TypeError):
+            ai_agent.function_schema["name"] = "other"
@@ -2,8 +2,10 @@
 Unit tests for cache manager.
 """
 import pytest
+import pytest_asyncio
 import asyncio
 import tempfile
+import time
 import shutil
 from pathlib import Path
 from unittest.mock import Mock, patch, MagicMock
@@ -20,13 +22,13 @@ def temp_cache_dir():
     shutil.rmtree(temp_dir, ignore_errors=True)
 
 
-@pytest.fixture
-def cache_manager(temp_cache_dir):
+@pytest_asyncio.fixture
+async def cache_manager(temp_cache_dir):
     """Create a CacheManager instance with temporary directory."""
     manager = CacheManager(cache_dir=temp_cache_dir, ttl=600)
     yield manager
-    # Cleanup
-    asyncio.run(manager.close())
+    # Cleanup on the session loop, where the background writer runs
+    await manager.close()
 
 
 @pytest.fixture
@@ -73,6 +75,63 @@ class TestCacheManager:
         assert retrieved_context.birthdate == sample_user_context.birthdate
         assert retrieved_context.topics == sample_user_context.topics
     
+    @pytest.mark.asyncio
+    async def test_get_served_from_l1(self, cache_manager, sample_user_context):
+        """Test that a recently set context is returned without touching DiskCache."""
+        user_id = "user_l1"
+        await cache_manager.set(user_id, sample_user_context)
+        
+        with patch.object(cache_manager.cache, "get") as disk_get:
+            retrieved_context = await cache_manager.get(user_id)
+        
+        assert retrieved_context is not sample_user_context
+        assert retrieved_context.to_cache() == sample_user_context.to_cache()
+        disk_get.assert_not_called()
+    
+    @pytest.mark.asyncio
+    async def test_l1_returns_copies(self, cache_manager, sample_user_context):
+        """Test that mutating a stored or returned context does not change the cached one."""
+        user_id = "user_l1_copy"
+        await cache_manager.set(user_id, sample_user_context)
+        history_length = len(sample_user_context.chatHistory)
+        
+        sample_user_context.append_messages(Message(role="user", content="Unsaved"))
+        retrieved = await cache_manager.get(user_id)
+        retrieved.chatInterest = "Changed"
+        retrieved.append_messages(Message(role="user", content="Also unsaved"))
+        
+        again = await cache_manager.get(user_id)
+        assert len(again.chatHistory) == history_length
+        assert again.chatInterest == "Python programming"
+    
+    @pytest.mark.asyncio
+    async def test_l1_entries_expire_before_cache_ttl(self, temp_cache_dir, sample_user_context):
+        """Test that L1 entries use their own short TTL and fall back to DiskCache."""
+        manager = CacheManager(cache_dir=temp_cache_dir, ttl=600, l1_ttl=5.0)
+        await manager.set("user_l1_ttl", sample_user_context)
+        await manager.flush()
+        
+        with patch("app.cache.time.monotonic", return_value=time.monotonic() + 10), \
+             patch.object(manager.cache, "get", wraps=manager.cache.get) as disk_get:
+            retrieved = await manager.get("user_l1_ttl")
+        
+        disk_get.assert_called_once_with("user_l1_ttl")
+        assert retrieved.to_cache() == sample_user_context.to_cache()
+        await manager.close()
+    
+    @pytest.mark.asyncio
+    async def test_set_writes_in_background(self, cache_manager, sample_user_context):
+        """Test that set returns before the DiskCache write and flush persists it."""
+        user_id = "user_write_behind"
+        await cache_manager.set(user_id, sample_user_context)
+        
+        assert user_id in cache_manager._pending
+        
+        await cache_manager.flush()
+        
+        assert not cache_manager._pending
+        assert cache_manager.cache.get(user_id)["chatInterest"] == sample_user_context.chatInterest
+    
     @pytest.mark.asyncio
     async def test_cache_miss(self, cache_manager):
         """Test cache miss for non-existent user."""
@@ -139,25 +198,16 @@ class TestCacheManager:
         
         await manager.close()
     
-    @pytest.mark.asyncio
-    async def test_check_and_summarize_not_needed(self, cache_manager, sample_user_context):
-        """Test check_and_summarize when summarization is not needed."""
-        user_id = "user789"
+    def test_needs_summarization_not_needed(self, sample_user_context):
+        """Test needs_summarization when summarization is not needed."""
         max_messages = 10
         overlap = 5
         
         # Context has only 2 messages, threshold is 15 (10 + 5)
-        needs_summarization, returned_context = await cache_manager.check_and_summarize(
-            user_id, sample_user_context, max_messages, overlap
-        )
-        
-        assert needs_summarization is False
-        assert returned_context == sample_user_context
+        assert CacheManager.needs_summarization(sample_user_context, max_messages, overlap) is False
     
-    @pytest.mark.asyncio
-    async def test_check_and_summarize_needed(self, cache_manager):
-        """Test check_and_summarize when summarization is needed."""
-        user_id = "user_overflow"
+    def test_needs_summarization_needed(self):
+        """Test needs_summarization when summarization is needed."""
         max_messages = 10
         overlap = 5
         
@@ -168,17 +218,10 @@ class TestCacheManager:
         ]
         context = UserContext(chatHistory=messages)
         
-        needs_summarization, returned_context = await cache_manager.check_and_summarize(
-            user_id, context, max_messages, overlap
-        )
-        
-        assert needs_summarization is True
-        assert returned_context == context
+        assert CacheManager.needs_summarization(context, max_messages, overlap) is True
     
-    @pytest.mark.asyncio
-    async def test_check_and_summarize_exact_threshold(self, cache_manager):
-        """Test check_and_summarize when message count equals threshold."""
-        user_id = "user_exact"
+    def test_needs_summarization_exact_threshold(self):
+        """Test needs_summarization when message count equals threshold."""
         max_messages = 10
         overlap = 5
         threshold = max_messages + overlap  # 15
@@ -190,13 +233,8 @@ class TestCacheManager:
         ]
         context = UserContext(chatHistory=messages)
         
-        needs_summarization, returned_context = await cache_manager.check_and_summarize(
-            user_id, context, max_messages, overlap
-        )
-        
         # At threshold, should not trigger (only > threshold triggers)
-        assert needs_summarization is False
-        assert returned_context == context
+        assert CacheManager.needs_summarization(context, max_messages, overlap) is False
     
     @pytest.mark.asyncio
     async def test_corrupted_cache_data(self, cache_manager):
@@ -204,7 +242,7 @@ class TestCacheManager:
         user_id = "user_corrupted"
         
         # Manually insert corrupted data into cache (invalid chatHistory structure)
-        loop = asyncio.get_event_loop()
+        loop = asyncio.get_running_loop()
         await loop.run_in_executor(
             None,
             lambda: cache_manager.cache.set(
@@ -219,8 +257,23 @@ class TestCacheManager:
         assert result is None
         
         # Verify corrupted entry was deleted
-        result = await cache_manager.get(user_id)
-        assert result is None
+        stored = await loop.run_in_executor(None, cache_manager.cache.get, user_id)
+        assert stored is None
+    
+    @pytest.mark.asyncio
+    async def test_entries_written_by_another_manager_are_found(self, temp_cache_dir, sample_user_context):
+        """Test a manager finds entries another worker wrote after it was created."""
+        reader = CacheManager(cache_dir=temp_cache_dir, ttl=600)
+        writer = CacheManager(cache_dir=temp_cache_dir, ttl=600)
+        await writer.set("user_persisted", sample_user_context)
+        await writer.close()
+        
+        try:
+            result = await reader.get("user_persisted")
+            assert result is not None
+            assert result.chatInterest == sample_user_context.chatInterest
+        finally:
+            await reader.close()
     
     @pytest.mark.asyncio
     async def test_multiple_users(self, cache_manager):
@@ -3,10 +3,11 @@ Unit tests for database service.
 """
 import pytest
 import asyncio
+import threading
 from unittest.mock import Mock, patch, MagicMock, AsyncMock
 from appwrite.exception import AppwriteException
 
-from app.db_service import DatabaseService
+from app.db_service import DatabaseService, _PooledClient, encode_chat_history, decode_chat_history
 from app.models import UserContext, Message
 
 
@@ -64,6 +65,16 @@ class TestDatabaseService:
         assert db_service.collection_id == "test_collection"
         assert db_service.databases is not None
         assert db_service.client is not None
+    
+    @pytest.mark.asyncio
+    async def test_warmup_ignores_errors(self, db_service):
+        """Test warmup issues a list query and does not raise when Appwrite is unreachable."""
+        with patch.object(db_service.databases, 'list_documents', return_value={}) as list_documents:
+            await db_service.warmup()
+        list_documents.assert_called_once()
+        
+        with patch.object(db_service.databases, 'list_documents', side_effect=Exception("unreachable")):
+            await db_service.warmup()
 
     
     @pytest.mark.asyncio
@@ -182,6 +193,64 @@ class TestDatabaseService:
             
             assert exc_info.value.code == 500
     
+    @pytest.mark.asyncio
+    async def test_update_chat_history_debounced(self, db_service):
+        """Test debounced updates are coalesced into one write with the latest state."""
+        db_service.write_debounce = 60
+        
+        with patch.object(db_service.databases, 'update_document', return_value={}) as update_document:
+            await db_service.update_chat_history("user123", [{"role": "user", "content": "Hi"}], chat_interest="Python")
+            await db_service.update_chat_history("user123", [{"role": "user", "content": "Hi again"}], "summary")
+            
+            update_document.assert_not_called()
+            
+            await db_service.flush()
+        
+        update_document.assert_called_once()
+        update_data = update_document.call_args.args[3]
+        assert update_data["chatHistory"] == [{"role": "user", "content": "Hi again"}]
+        assert update_data["userSummary"] == "summary"
+        assert update_data["chatInterest"] == "Python"
+    
+    @pytest.mark.asyncio
+    async def test_update_chat_history_sends_only_changed_fields(self, db_service):
+        """Test fields equal to the last write are left out, and no-op updates are skipped."""
+        with patch.object(db_service.databases, 'update_document', return_value={}) as update_document:
+            await db_service.update_chat_history("user123", ["blob1"], "summary", chat_interest="Python")
+            await db_service.update_chat_history("user123", ["blob2"], "summary", chat_interest="Python")
+            
+            assert update_document.call_args.args[3] == {"chatHistory": ["blob2"]}
+            
+            await db_service.update_chat_history("user123", ["blob2"], "summary")
+        
+        assert update_document.call_count == 2
+    
+    @pytest.mark.asyncio
+    async def test_update_chat_history_creates_missing_document(self, db_service):
+        """Test an update for a user without a document creates it instead."""
+        missing = AppwriteException("Document not found", 404, "document_not_found")
+        
+        with patch('app.utils.asyncio.sleep', new=AsyncMock()), \
+             patch.object(db_service.databases, 'update_document', side_effect=missing), \
+             patch.object(db_service.databases, 'create_document', return_value={}) as create_document:
+            await db_service.update_chat_history(
+                user_id="user123",
+                chat_history=["blob"],
+                user_summary="Summary",
+                chat_interest="Python",
+                birthdate="1990-01-01",
+                topics=["Python", "AI"]
+            )
+        
+        create_document.assert_called_once()
+        assert create_document.call_args.args[3] == {
+            "chatHistory": ["blob"],
+            "chatInterest": "Python",
+            "userSummary": "Summary",
+            "birthdate": "1990-01-01",
+            "topics": ["Python", "AI"]
+        }
+    
     @pytest.mark.asyncio
     async def test_create_user_context_success(self, db_service, sample_user_context):
         """Test successful user context creation."""
@@ -347,3 +416,81 @@ class TestDatabaseService:
         assert context.userSummary == ""
         assert context.birthdate is None
         assert context.topics == []
+    
+    def test_chat_history_round_trip(self, sample_user_context):
+        """Test chat history is stored as one JSON element per message and decodes back."""
+        encoded = encode_chat_history(sample_user_context.chatHistory)
+        
+        assert len(encoded) == len(sample_user_context.chatHistory)
+        assert decode_chat_history(encoded) == [
+            {"role": msg.role, "content": msg.content}
+            for msg in sample_user_context.chatHistory
+        ]
+    
+    def test_decode_per_message_chat_history(self):
+        """Test the json.dumps one-string-per-message layout decodes."""
+        legacy = ['{"role": "user", "content": "Hi"}', '{"role": "assistant", "content": "Hello"}']
+        
+        assert decode_chat_history(legacy) == [
+            {"role": "user", "content": "Hi"},
+            {"role": "assistant", "content": "Hello"}
+        ]
+    
+    def test_decode_single_blob_chat_history(self):
+        """Test documents holding the whole history in one element still decode."""
+        blob = ['[{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hello"}]']
+        
+        assert decode_chat_history(blob) == [
+            {"role": "user", "content": "Hi"},
+            {"role": "assistant", "content": "Hello"}
+        ]
+    
+    def test_pooled_client_uses_one_session_per_thread(self, db_service):
+        """Test the Appwrite client keeps a Session per I/O thread."""
+        client = db_service.client
+        assert isinstance(client, _PooledClient)
+        
+        sessions = []
+        
+        def record_session():
+            sessions.append(client._session())
+        
+        record_session()
+        record_session()
+        worker = threading.Thread(target=record_session)
+        worker.start()
+        worker.join()
+        
+        assert sessions[0] is sessions[1]
+        assert sessions[0] is not sessions[2]
+    
+    def test_pooled_client_call_goes_through_session(self, db_service):
+        """Test JSON calls are sent on the thread's Session and errors keep their status."""
+        client = db_service.client
+        ok = MagicMock(headers={"Content-Type": "application/json"})
+        ok.json.return_value = {"$id": "user123"}
+        missing = MagicMock(
+            status_code=404,
+            text='{"message": "Document not found"}',
+            headers={"Content-Type": "application/json"}
+        )
+        missing.raise_for_status.side_effect = Exception("404")
+        missing.json.return_value = {"message": "Document not found", "type": "document_not_found"}
+        
+        with patch.object(client._session(), "request", side_effect=[ok, missing]) as request:
+            result = client.call(
+                "patch", "/databases/db/collections/c/documents/user123",
+                {"content-type": "application/json"}, {"data": {"userSummary": "Summary"}}
+            )
+            with pytest.raises(AppwriteException) as exc_info:
+                client.call("get", "/databases/db/collections/c/documents/missing", {}, {})
+        
+        assert result == {"$id": "user123"}
+        assert exc_info.value.code == 404
+        first = request.call_args_list[0].kwargs
+        assert first["url"] == "https://test.appwrite.io/v1/databases/db/collections/c/documents/user123"
+        assert first["data"] == '{"data": {"userSummary": "Summary"}}'
+        assert first["headers"]["x-appwrite-project"] == "test_project"
+        second = request.call_args_list[1].kwargs
+        assert second["url"] == "https://test.appwrite.io/v1/databases/db/collections/c/documents/missing"
+        assert second["data"] == {}
@@ -109,6 +109,12 @@ class TestMessage:
         errors = exc_info.value.errors()
         assert any('role' in str(error) for error in errors)
     
+    def test_message_is_immutable(self):
+        """Test Message instances are frozen."""
+        message = Message(role="user", content="Hello")
+        with pytest.raises(ValidationError):
+            message.content = "Changed"
+    
     def test_missing_content(self):
         """Test validation error when content is missing."""
         with pytest.raises(ValidationError):
@@ -157,3 +163,58 @@ class TestUserContext:
         assert context.chatInterest is None
         assert context.userSummary == ""
         assert len(context.topics) == 1
+    
+    def test_cache_round_trip(self):
+        """Test UserContext survives to_cache/from_cache unchanged."""
+        context = UserContext(
+            chatHistory=[
+                Message(role="user", content="Hello"),
+                Message(role="assistant", content="Hi there!")
+            ],
+            chatInterest="Python",
+            userSummary="User is learning Python",
+            birthdate="1990-01-01",
+            topics=["Python", "AI"]
+        )
+        assert UserContext.from_cache(context.to_cache()) == context
+    
+    def test_from_cache_legacy_payload(self):
+        """Test from_cache accepts model_dump() payloads and rejects malformed ones."""
+        context = UserContext(chatHistory=[Message(role="user", content="Hello")])
+        assert UserContext.from_cache(context.model_dump()) == context
+        
+        with pytest.raises(ValueError):
+            UserContext.from_cache({"chatHistory": "not_a_list"})
+    
+    def test_append_messages_caps_history(self):
+        """Test append_messages drops the oldest messages past max_length."""
+        context = UserContext(chatHistory=[
+            Message(role="user", content=f"Message {i}") for i in range(4)
+        ])
+        context.append_messages(
+            Message(role="user", content="Hello"),
+            Message(role="assistant", content="Hi there!"),
+            max_length=5
+        )
+        
+        assert len(context.chatHistory) == 5
+        assert context.chatHistory[0].content == "Message 1"
+        assert context.chatHistory[-1].content == "Hi there!"
+        
+        context.append_messages(Message(role="user", content="Again"))
+        assert len(context.chatHistory) == 6
+    
+    def test_trim_history_in_place(self):
+        """Test trim_history keeps the most recent messages in the same list."""
+        context = UserContext(chatHistory=[
+            Message(role="user", content=f"Message {i}") for i in range(5)
+        ])
+        history = context.chatHistory
+        
+        context.trim_history(2)
+        
+        assert context.chatHistory is history
+        assert [msg.content for msg in history] == ["Message 3", "Message 4"]
+        
+        context.trim_history(0)
+        assert history == []
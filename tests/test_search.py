@@ -4,18 +4,32 @@ import pytest
 import asyncio
 import httpx
 from unittest.mock import AsyncMock, MagicMock, patch
+import app.search as search_module
 from app.search import SearchService
 
 
 @pytest.fixture
-def search_service():
-    """Create a SearchService instance for testing."""
+def search_service(monkeypatch):
+    """Create a SearchService instance with its own HTTP client for testing."""
+    # The HTTP client is shared at module level; give each test a fresh one
+    # so mocks assigned to it do not leak between tests
+    monkeypatch.setattr(search_module, "_CLIENT", None)
     service = SearchService(api_key="test_api_key", timeout=10.0)
     yield service
     # Cleanup
     asyncio.run(service.close())
 
 
+def _parse_with_fallback(html_content, count):
+    """Run the stdlib DuckDuckGoParser the way _format_results does without lxml."""
+    parser = search_module.DuckDuckGoParser(target=count)
+    try:
+        parser.feed(html_content)
+    except search_module._Stop:
+        pass
+    return parser.results[:count]
+
+
 @pytest.fixture
 def mock_brave_response():
     """Create a mock Brave API response."""
@@ -243,6 +257,61 @@ class TestSearchService:
         
         assert formatted == []
     
+    def test_format_results_duckduckgo_html(self, search_service):
+        """Test DuckDuckGo HTML results are extracted and limited to count."""
+        html_content = (
+            '<html><body>'
+            '<div class="result"><a class="result__a" href="https://example.com/1">First</a>'
+            '<a class="result__snippet" href="#">First snippet</a></div>'
+            '<div class="result"><a class="result__a" href="https://example.com/2">Second</a></div>'
+            '<div class="result"><a class="result__a" href="https://example.com/3">Third</a></div>'
+            '</body></html>'
+        )
+        
+        formatted = search_service._format_results(html_content, 2)
+        
+        assert formatted == [
+            {"title": "First", "url": "https://example.com/1", "description": "First snippet"},
+            {"title": "Second", "url": "https://example.com/2", "description": ""}
+        ]
+    
+    @pytest.mark.parametrize("parse", ["lxml", "fallback"])
+    def test_parsers_match_multi_class_results(self, parse):
+        """Test the lxml and stdlib parsers agree on results with several classes."""
+        if parse == "lxml":
+            if search_module.lxml_html is None:
+                pytest.skip("lxml is not installed")
+            parse_results = search_module._parse_with_lxml
+        else:
+            parse_results = _parse_with_fallback
+        html_content = (
+            '<div class="result results_links web-result">'
+            '<a class="result__a" href="https://example.com/1">First</a>'
+            '<a class="result__snippet" href="#">First snippet</a></div>'
+            '<div class="result__body"><a class="result__a" href="https://example.com/x">Not a result</a></div>'
+            '<div class="web-result result"><a class="result__a" href="https://example.com/2">Second</a></div>'
+        )
+        
+        assert parse_results(html_content, 5) == [
+            {"title": "First", "url": "https://example.com/1", "description": "First snippet"},
+            {"title": "Second", "url": "https://example.com/2", "description": ""}
+        ]
+    
+    def test_format_results_single_quoted_class(self, search_service):
+        """Test results are found when class attributes are single-quoted or unquoted."""
+        html_content = (
+            "<html><body>"
+            "<div class='result'><a class='result__a' href='https://example.com/1'>First</a></div>"
+            "<div class=result><a class=result__a href=https://example.com/2>Second</a></div>"
+            "</body></html>"
+        )
+        
+        formatted = search_service._format_results(html_content, 5)
+        
+        assert [result["url"] for result in formatted] == [
+            "https://example.com/1", "https://example.com/2"
+        ]
+    
     @pytest.mark.asyncio
     async def test_search_request_headers(self, search_service, mock_brave_response):
         """Test that search includes correct headers."""
@@ -296,14 +365,69 @@ class TestSearchService:
     @pytest.mark.asyncio
     async def test_close(self, search_service):
         """Test closing the search service."""
-        # Mock the aclose method
-        search_service.client.aclose = AsyncMock()
+        # Mock the aclose method; client is a property, so keep the instance
+        client = search_service.client
+        client.aclose = AsyncMock()
         
         # Close the service
         await search_service.close()
         
-        # Verify aclose was called
-        search_service.client.aclose.assert_called_once()
+        # Verify aclose was called and the shared client was released
+        client.aclose.assert_called_once()
+        assert search_module._CLIENT is None
+    
+    @pytest.mark.asyncio
+    async def test_search_results_cached(self, search_service):
+        """Test repeated queries are served from the result cache as copies."""
+        results = [{"title": "Title", "url": "https://example.com", "description": "Desc"}]
+        search_service._perform_search = AsyncMock(return_value=results)
+        
+        first = await search_service.search("Python")
+        first[0]["title"] = "Mutated"
+        second = await search_service.search("  python ")
+        
+        search_service._perform_search.assert_called_once()
+        assert second == results
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_identical_searches_share_request(self, search_service):
+        """Test concurrent identical queries are coalesced into one upstream search."""
+        results = [{"title": "Title", "url": "https://example.com", "description": "Desc"}]
+        
+        async def slow_search(query, count, **kwargs):
+            await asyncio.sleep(0.05)
+            return results
+        
+        search_service._perform_search = AsyncMock(side_effect=slow_search)
+        
+        all_results = await asyncio.gather(*(search_service.search("python") for _ in range(5)))
+        
+        search_service._perform_search.assert_called_once()
+        assert all(result == results for result in all_results)
+        assert search_service._inflight == {}
+    
+    @pytest.mark.asyncio
+    async def test_cancelled_leader_does_not_empty_follower_results(self, search_service):
+        """Test a follower still gets real results when the search it joined is cancelled by its leader."""
+        results = [{"title": "Title", "url": "https://example.com", "description": "Desc"}]
+        
+        async def slow_search(query, count, **kwargs):
+            await asyncio.sleep(0.05)
+            return results
+        
+        search_service._perform_search = AsyncMock(side_effect=slow_search)
+        
+        leader = asyncio.create_task(search_service.search("python"))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(search_service.search("python"))
+        await asyncio.sleep(0)
+        leader.cancel()
+        
+        assert await follower == results
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        search_service._perform_search.assert_called_once()
+        assert search_service._inflight == {}
     
     @pytest.mark.asyncio
     async def test_multiple_searches(self, search_service, mock_brave_response):
@@ -0,0 +1,51 @@
+"""Unit tests for the semantic response cache."""
+
+import pytest
+from unittest.mock import patch
+from app.semantic_cache import SemanticResponseCache
+
+
+_VECTORS = {
+    "What is Python?": [1.0, 0.0, 0.0],
+    "what is python": [0.99, 0.1, 0.0],
+    "Tell me about Rust": [0.0, 1.0, 0.0],
+}
+
+
+async def fake_embed(text):
+    """Return a fixed embedding per test message."""
+    return _VECTORS[text]
+
+
+@pytest.fixture
+def semantic_cache():
+    """Create a SemanticResponseCache with a fake embedding function."""
+    return SemanticResponseCache(fake_embed, threshold=0.9, ttl=60)
+
+
+class TestSemanticResponseCache:
+    """Tests for SemanticResponseCache class."""
+    
+    @pytest.mark.asyncio
+    async def test_similar_message_hits_in_same_scope(self, semantic_cache):
+        """Test a near-duplicate message reuses the response only within its scope."""
+        embedding = await semantic_cache.embed("What is Python?")
+        semantic_cache.store("scope", embedding, "Python is a language.")
+        
+        similar = await semantic_cache.embed("what is python")
+        different = await semantic_cache.embed("Tell me about Rust")
+        
+        assert semantic_cache.lookup("scope", similar) == "Python is a language."
+        assert semantic_cache.lookup("scope", different) is None
+        assert semantic_cache.lookup("other_scope", similar) is None
+    
+    @pytest.mark.asyncio
+    async def test_expired_entries_are_not_returned(self, semantic_cache):
+        """Test entries older than the TTL are dropped on lookup."""
+        embedding = await semantic_cache.embed("What is Python?")
+        
+        with patch("app.semantic_cache.time.monotonic", return_value=0.0):
+            semantic_cache.store("scope", embedding, "Python is a language.")
+        
+        with patch("app.semantic_cache.time.monotonic", return_value=120.0):
+            assert semantic_cache.lookup("scope", embedding) is None
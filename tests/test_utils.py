@@ -2,10 +2,11 @@
 
 import pytest
 import asyncio
+import httpx
 from unittest.mock import patch, MagicMock, call
 from loguru import logger
 import sys
-from app.utils import configure_logging, log_execution_time, retry_with_backoff
+from app.utils import configure_logging, dedupe_context, log_execution_time, retry_with_backoff
 
 
 class TestConfigureLogging:
@@ -307,3 +308,64 @@ class TestRetryWithBackoff:
         # Verify function succeeded after different errors
         assert call_count == 3
         assert result == "success"
+    
+    @pytest.mark.asyncio
+    async def test_non_retryable_errors_raise_immediately(self):
+        """Test exceptions outside retry_on and non-transient HTTP statuses are not retried."""
+        request = httpx.Request("POST", "https://example.com")
+        call_count = 0
+        
+        async def not_found():
+            nonlocal call_count
+            call_count += 1
+            raise httpx.HTTPStatusError("Not found", request=request, response=httpx.Response(404, request=request))
+        
+        with pytest.raises(httpx.HTTPStatusError):
+            await retry_with_backoff(not_found, max_retries=3, base_delay=0.01)
+        assert call_count == 1
+        
+        async def bad_value():
+            nonlocal call_count
+            call_count += 1
+            raise ValueError("Bad value")
+        
+        with pytest.raises(ValueError):
+            await retry_with_backoff(bad_value, max_retries=3, base_delay=0.01, retry_on=(httpx.TransportError,))
+        assert call_count == 2
+
+
+class TestDedupeContext:
+    """Tests for dedupe_context."""
+    
+    def test_repeated_paragraph_replaced_with_reference(self):
+        """Test a long paragraph repeated in a later message is replaced."""
+        block = "Lorem ipsum dolor sit amet. " * 10
+        messages = [
+            {"role": "user", "content": f"Please review:\n\n{block}"},
+            {"role": "assistant", "content": f"{block}\n\nLooks good."},
+            {"role": "user", "content": "Thanks"}
+        ]
+        
+        result = dedupe_context(messages)
+        
+        assert result[0] is messages[0]
+        assert result[1]["content"] == (
+            '[repeated text omitted: same as the passage starting '
+            '"Lorem ipsum dolor sit amet. Lorem ipsum dolor sit amet. Lore..." '
+            'in an earlier user message]\n\nLooks good.'
+        )
+        assert result[2] is messages[2]
+        # Input messages are not mutated
+        assert messages[1]["content"].startswith(block)
+    
+    def test_short_paragraphs_and_current_turn_kept(self):
+        """Test short repeats and the latest message are left untouched."""
+        block = "x" * 300
+        messages = [
+            {"role": "user", "content": "Yes"},
+            {"role": "assistant", "content": block},
+            {"role": "user", "content": "Yes"},
+            {"role": "user", "content": block}
+        ]
+        
+        assert dedupe_context(messages) == messages